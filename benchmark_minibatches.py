@@ -0,0 +1,63 @@
+#! /usr/bin/python
+# -*- coding: utf8 -*-
+
+
+import tensorlayer as tl
+import numpy as np
+import argparse
+import time
+
+"""Benchmark of tl.iterate.minibatches with shuffle=True, with a new array
+for every batch (n_buffers=None) against a ring of preallocated buffers
+(n_buffers=1, 2, ...).
+
+The data has the shape of CIFAR-10 (50000x32x32x3 float32) by default. Each
+setting iterates over n_epochs shuffled epochs, the consumer reads every
+batch once, as feeding it to a session would, and the best epoch time is
+reported with the number of bytes allocated for the batches.
+
+$ python benchmark_minibatches.py --batch_size=128 --n_epochs=5
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n_examples", type=int, default=50000)
+    parser.add_argument("--shape", type=str, default="32,32,3", help="The shape of an example.")
+    parser.add_argument("--batch_size", type=int, default=128)
+    parser.add_argument("--n_epochs", type=int, default=5)
+    parser.add_argument("--n_buffers", type=str, default="None,1,2")
+    args = parser.parse_args()
+
+    shape = tuple(int(s) for s in args.shape.split(','))
+    X = np.random.rand(*((args.n_examples,) + shape)).astype(np.float32)
+    y = np.random.randint(0, 10, size=args.n_examples).astype(np.int64)
+    n_batches = args.n_examples // args.batch_size
+    batch_bytes = args.batch_size * (X[0].nbytes + y[0].nbytes)
+    print("data: %s float32 (%.1f MB), batch_size: %d, %d batches per epoch" % (
+        str(X.shape), X.nbytes / 1e6, args.batch_size, n_batches))
+
+    results = []
+    for n_buffers in args.n_buffers.split(','):
+        n_buffers = None if n_buffers == 'None' else int(n_buffers)
+        best = None
+        for epoch in range(args.n_epochs):
+            start_time = time.time()
+            total = 0.
+            for X_a, y_a in tl.iterate.minibatches(X, y, args.batch_size, shuffle=True,
+                                                    n_buffers=n_buffers, seed=epoch):
+                total += X_a[0, 0].sum() + y_a[0]
+            epoch_time = time.time() - start_time
+            best = epoch_time if best is None else min(best, epoch_time)
+        allocated = batch_bytes * (n_batches if n_buffers is None else n_buffers)
+        results.append((n_buffers, best, allocated))
+        print("n_buffers=%s: %.4fs per epoch, %.0f batches/s, %.1f MB allocated for the batches per epoch" % (
+            n_buffers, best, n_batches / best, allocated / 1e6))
+
+    base_time = results[0][1]
+    for n_buffers, best, _ in results[1:]:
+        print("n_buffers=%s: speedup %.2fx over n_buffers=%s" % (n_buffers, base_time / best, results[0][0]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+#! /usr/bin/python
+# -*- coding: utf8 -*-
+
+
+import tensorflow as tf
+import tensorlayer as tl
+import numpy as np
+import time
+
+"""Benchmark of FusedLSTMLayer against RNNLayer with BasicLSTMCell, on the
+PTB language model of tutorial_ptb_lstm.py.
+
+The same 2-layer LSTM model is built with each layer in its own graph,
+trained for a number of steps on the PTB training data, and the speed is
+reported in words per second, as tutorial_ptb_lstm.py. The first steps are
+not timed. Before training, the parameters of the RNNLayer model are
+assigned to the FusedLSTMLayer model, and the costs of one batch are
+compared, as both layers must compute the same LSTM.
+
+$ python benchmark_ptb_lstm.py --model=small --n_steps=200
+"""
+
+flags = tf.flags
+flags.DEFINE_string(
+    "model", "small",
+    "A type of model. Possible options are: small, medium, large.")
+flags.DEFINE_integer("n_steps", 200, "The number of timed training steps.")
+flags.DEFINE_integer("n_warmup", 10, "The number of training steps before timing.")
+FLAGS = flags.FLAGS
+
+
+def main(_):
+    if FLAGS.model == "small":
+        init_scale = 0.1
+        num_steps = 20
+        hidden_size = 200
+    elif FLAGS.model == "medium":
+        init_scale = 0.05
+        num_steps = 35
+        hidden_size = 650
+    elif FLAGS.model == "large":
+        init_scale = 0.04
+        num_steps = 35
+        hidden_size = 1500
+    else:
+        raise ValueError("Invalid model: %s", FLAGS.model)
+    learning_rate = 1.0
+    max_grad_norm = 5
+    batch_size = 20
+
+    # Load PTB dataset
+    train_data, valid_data, test_data, vocab_size = tl.files.load_ptb_dataset()
+
+    def build(fused):
+        input_data = tf.placeholder(tf.int32, [batch_size, num_steps])
+        targets = tf.placeholder(tf.int32, [batch_size, num_steps])
+        initializer = tf.random_uniform_initializer(-init_scale, init_scale)
+        with tf.variable_scope("model"):
+            network = tl.layers.EmbeddingInputlayer(
+                        inputs = input_data,
+                        vocabulary_size = vocab_size,
+                        embedding_size = hidden_size,
+                        E_init = initializer,
+                        name ='embedding_layer')
+            lstms = []
+            for k in range(2):
+                if fused:
+                    network = tl.layers.FusedLSTMLayer(network,
+                                forget_bias=0.0,
+                                n_hidden=hidden_size,
+                                initializer=initializer,
+                                n_steps=num_steps,
+                                return_seq_2d=(k == 1),
+                                name='lstm_layer%d' % (k + 1))
+                else:
+                    network = tl.layers.RNNLayer(network,
+                                cell_fn=tf.nn.rnn_cell.BasicLSTMCell,
+                                cell_init_args={'forget_bias': 0.0},
+                                n_hidden=hidden_size,
+                                initializer=initializer,
+                                n_steps=num_steps,
+                                return_last=False,
+                                return_seq_2d=(k == 1),
+                                name='lstm_layer%d' % (k + 1))
+                lstms.append(network)
+            network = tl.layers.DenseLayer(network,
+                        n_units=vocab_size,
+                        W_init=initializer,
+                        b_init=initializer,
+                        act = tl.activation.identity, name='output_layer')
+        loss = tf.nn.seq2seq.sequence_loss_by_example(
+            [network.outputs],
+            [tf.reshape(targets, [-1])],
+            [tf.ones([batch_size * num_steps])])
+        cost = tf.reduce_sum(loss) / batch_size
+        tvars = tf.trainable_variables()
+        grads, _ = tf.clip_by_global_norm(tf.gradients(cost, tvars), max_grad_norm)
+        train_op = tf.train.GradientDescentOptimizer(learning_rate).apply_gradients(zip(grads, tvars))
+        return input_data, targets, network, lstms, cost, train_op
+
+    def run(fused, params=None):
+        graph = tf.Graph()
+        with graph.as_default():
+            tl.layers.clear_layers_name()
+            input_data, targets, network, lstms, cost, train_op = build(fused)
+            sess = tf.Session(graph=graph)
+            with sess.as_default():
+                sess.run(tf.initialize_all_variables())
+                if params is None:
+                    params = sess.run(network.all_params)
+                else:
+                    tl.files.assign_params(sess, params, network)
+                batches = tl.iterate.ptb_iterator(train_data, batch_size, num_steps)
+                x, y = next(batches)
+                first_cost = sess.run(cost, feed_dict={input_data: x, targets: y})
+                states = [tl.layers.initialize_rnn_state(lstm.initial_state, sess) for lstm in lstms]
+                iters = 0
+                for step, (x, y) in enumerate(batches):
+                    if step == FLAGS.n_warmup:
+                        start_time = time.time()
+                    if step == FLAGS.n_warmup + FLAGS.n_steps:
+                        break
+                    feed_dict = {input_data: x, targets: y}
+                    for lstm, state in zip(lstms, states):
+                        feed_dict[lstm.initial_state] = state
+                    results = sess.run([train_op] + [lstm.final_state for lstm in lstms], feed_dict=feed_dict)
+                    states = results[1:]
+                    if step >= FLAGS.n_warmup:
+                        iters += num_steps
+                wps = iters * batch_size / (time.time() - start_time)
+            sess.close()
+        return params, first_cost, wps
+
+    params, basic_cost, basic_wps = run(fused=False)
+    _, fused_cost, fused_wps = run(fused=True, params=params)
+    print("\nmodel: %s, %d timed steps" % (FLAGS.model, FLAGS.n_steps))
+    print("RNNLayer with BasicLSTMCell: cost %.5f speed: %.0f wps" % (basic_cost, basic_wps))
+    print("FusedLSTMLayer             : cost %.5f speed: %.0f wps" % (fused_cost, fused_wps))
+    print("speedup: %.2fx, cost difference: %g" % (fused_wps / basic_wps, abs(fused_cost - basic_cost)))
+
+
+if __name__ == "__main__":
+    tf.app.run()
@@ -9,11 +9,35 @@ import sys
 import re
 from . import visualize
 import collections
+import itertools
+import hashlib
+import json
+import shutil
+import tempfile
+import contextlib
+import threading
+import multiprocessing
+import time
+import zlib
 from six.moves import xrange
+from six.moves import urllib
+from six.moves import queue
 import six
 
+## Dynamically set the folder and mirror of the datasets, see set_data_dir()
+_data_config = {'data_dir': '', 'mirror': None}
+## The SHA-256 digests the downloaded datasets are verified against, a file
+## which is not listed here is verified by its size only (if known)
+_dataset_sha256 = {
+    'train-images-idx3-ubyte.gz': '440fcabf73cc546fa21475e81ea370265605f56be210a4024d2ca8f203523609',
+    'train-labels-idx1-ubyte.gz': '3552534a0a558bbed6aed32b30c495cca23d567ec52cac8be1a0730e8010255c',
+    't10k-images-idx3-ubyte.gz': '8d422c7b0a1c1c79245a5bcf07fe86e33eeafee792b84584aec276f5a2dbc4e6',
+    't10k-labels-idx1-ubyte.gz': 'f7ae60f92e00ec6debd23a6088c31dbd2371eca3ffa0defaefb259924204aec6',
+    'cifar-10-python.tar.gz': '6d958be074577803d12ecdefd02955f39262c83c16fe9348329d7fe0b5c001ce',
+}
+
 ## Load dataset functions
-def load_mnist_dataset(shape=(-1,784)):
+def load_mnist_dataset(shape=(-1,784), cache_dir=None):
     """Automatically download MNIST dataset
     and return the training, validation and test set with 50000, 10000 and 10000
     digit images respectively.
@@ -22,28 +46,28 @@ def load_mnist_dataset(shape=(-1,784)):
     ----------
     shape : tuple
         The shape of digit images
+    cache_dir : a string or None
+        If given, the decoded arrays are saved into this folder as .npy files
+        the first time, and memory-mapped (read-only) on later calls, so
+        starting a new process is fast and the processes share the page cache.
+        The cache is rebuilt when the checksum of the source files changes.
 
     Examples
     --------
     >>> X_train, y_train, X_val, y_val, X_test, y_test = tl.files.load_mnist_dataset(shape=(-1,784))
+    >>> X_train, y_train, X_val, y_val, X_test, y_test = tl.files.load_mnist_dataset(shape=(-1,784), cache_dir='data_cache')
     """
-    # We first define a download function, supporting both Python 2 and 3.
-    if sys.version_info[0] == 2:
-        from urllib import urlretrieve
-    else:
-        from urllib.request import urlretrieve
-
+    # We first define a download function.
     def download(filename, source='http://yann.lecun.com/exdb/mnist/'):
-        print("Downloading %s" % filename)
-        urlretrieve(source + filename, filename)
+        return maybe_download_and_extract(filename, data_dir, source,
+                        sha256=_dataset_sha256.get(filename))
 
     # We then define functions for loading MNIST images and labels.
     # For convenience, they also download the requested files if needed.
     import gzip
 
     def load_mnist_images(filename):
-        if not os.path.exists(filename):
-            download(filename)
+        filename = download(filename)
         # Read the inputs in Yann LeCun's binary format.
         with gzip.open(filename, 'rb') as f:
             data = np.frombuffer(f.read(), np.uint8, offset=16)
@@ -59,8 +83,7 @@ def load_mnist_dataset(shape=(-1,784)):
         return data / np.float32(256)
 
     def load_mnist_labels(filename):
-        if not os.path.exists(filename):
-            download(filename)
+        filename = download(filename)
         # Read the labels in Yann LeCun's binary format.
         with gzip.open(filename, 'rb') as f:
             data = np.frombuffer(f.read(), np.uint8, offset=8)
@@ -68,14 +91,27 @@ def load_mnist_dataset(shape=(-1,784)):
         return data
 
     # We can now download and read the training and test set images and labels.
-    ## you may want to change the path
-    data_dir = ''   #os.getcwd() + '/lasagne_tutorial/'
+    ## you may want to change the path, see set_data_dir()
+    data_dir = _data_config['data_dir']
     # print('data_dir > %s' % data_dir)
 
-    X_train = load_mnist_images(data_dir+'train-images-idx3-ubyte.gz')
-    y_train = load_mnist_labels(data_dir+'train-labels-idx1-ubyte.gz')
-    X_test = load_mnist_images(data_dir+'t10k-images-idx3-ubyte.gz')
-    y_test = load_mnist_labels(data_dir+'t10k-labels-idx1-ubyte.gz')
+    def load_all():
+        X_train = load_mnist_images('train-images-idx3-ubyte.gz')
+        y_train = load_mnist_labels('train-labels-idx1-ubyte.gz')
+        X_test = load_mnist_images('t10k-images-idx3-ubyte.gz')
+        y_test = load_mnist_labels('t10k-labels-idx1-ubyte.gz')
+        return X_train, y_train, X_test, y_test
+
+    if cache_dir is None:
+        X_train, y_train, X_test, y_test = load_all()
+    else:
+        sources = [download(filename) for filename in ['train-images-idx3-ubyte.gz',
+                    'train-labels-idx1-ubyte.gz', 't10k-images-idx3-ubyte.gz', 't10k-labels-idx1-ubyte.gz']]
+        X_train, y_train, X_test, y_test = _load_cached_arrays(cache_dir, 'mnist', sources,
+                                    ['X_train', 'y_train', 'X_test', 'y_test'], load_all)
+        # the images of all shapes have the same memory layout
+        X_train = X_train.reshape(shape)
+        X_test = X_test.reshape(shape)
 
     # We reserve the last 10000 training examples for validation.
     X_train, X_val = X_train[:-10000], X_train[-10000:]
@@ -98,7 +134,7 @@ def load_mnist_dataset(shape=(-1,784)):
     # (It doesn't matter how we do this as long as we can read them again.)
     return X_train, y_train, X_val, y_val, X_test, y_test
 
-def load_cifar10_dataset(shape=(-1, 32, 32, 3), plotable=False, second=3):
+def load_cifar10_dataset(shape=(-1, 32, 32, 3), plotable=False, second=3, cache_dir=None, dtype=np.float32):
     """The CIFAR-10 dataset consists of 60000 32x32 colour images in 10 classes, with
     6000 images per class. There are 50000 training images and 10000 test images.
 
@@ -116,10 +152,25 @@ def load_cifar10_dataset(shape=(-1, 32, 32, 3), plotable=False, second=3):
         Whether to plot some image examples.
     second : int
         If 'plotable' is True, 'second' is the display time.
+    cache_dir : a string or None
+        If given, the decoded arrays are saved into this folder as .npy files
+        the first time, and memory-mapped (read-only) on later calls, see
+        :func:`load_mnist_dataset`.
+    dtype : numpy data type
+        The data type of the images. Use np.uint8 to keep the raw bytes, the
+        training set then takes 150 MB instead of 600 MB as float32, and convert
+        the minibatches to float when they are used.
 
     Examples
     --------
     >>> X_train, y_train, X_test, y_test = tl.files.load_cifar10_dataset(shape=(-1, 32, 32, 3), plotable=True)
+    >>> X_train, y_train, X_test, y_test = tl.files.load_cifar10_dataset(shape=(-1, 32, 32, 3), cache_dir='data_cache')
+    ...
+    >>> Keep the images as uint8, feed_dict converts each minibatch to the
+    >>> float32 dtype of the placeholder
+    >>> X_train, y_train, X_test, y_test = tl.files.load_cifar10_dataset(shape=(-1, 32, 32, 3), dtype=np.uint8)
+    >>> for X_train_a, y_train_a in tl.iterate.minibatches(X_train, y_train, batch_size, shuffle=True):
+    >>>     sess.run(train_op, feed_dict={x: X_train_a, y_: y_train_a})
 
     Note
     ------
@@ -151,37 +202,12 @@ def load_cifar10_dataset(shape=(-1, 32, 32, 3), plotable=False, second=3):
     import numpy as np
 
 
-    # We first define a download function, supporting both Python 2 and 3.
-    filename = 'cifar-10-python.tar.gz'
-    if sys.version_info[0] == 2:
-        from urllib import urlretrieve
-    else:
-        from urllib.request import urlretrieve
-
-    def download(filename, source='https://www.cs.toronto.edu/~kriz/'):
-        print("Downloading %s" % filename)
-        urlretrieve(source + filename, filename)
-
-    # After downloading the cifar-10-python.tar.gz, we need to unzip it.
-    import tarfile
-    def un_tar(file_name):
-        print("Extracting %s" % file_name)
-        tar = tarfile.open(file_name)
-        names = tar.getnames()
-        # if os.path.isdir(file_name + "_files"):
-        #     pass
-        # else:
-        #     os.mkdir(file_name + "_files")
-        for name in names:
-            tar.extract(name) #, file_name.split('.')[0])
-        tar.close()
-        print("Extracted to %s" % names[0])
-
-
-    if not os.path.exists('cifar-10-batches-py'):
-        download(filename)
-        un_tar(filename)
+    path = _data_config['data_dir'] # you can set a dir to the data here, see set_data_dir().
 
+    # Download the cifar-10-python.tar.gz, and unzip it.
+    maybe_download_and_extract('cifar-10-python.tar.gz', path,
+                        'https://www.cs.toronto.edu/~kriz/', extract=True, extract_dir='cifar-10-batches-py',
+                        sha256=_dataset_sha256.get('cifar-10-python.tar.gz'))
 
     def unpickle(file):
         fp = open(file, 'rb')
@@ -192,37 +218,49 @@ def load_cifar10_dataset(shape=(-1, 32, 32, 3), plotable=False, second=3):
         fp.close()
         return data
 
-    X_train = None
-    y_train = []
-
-    path = '' # you can set a dir to the data here.
-
-    for i in range(1,6):
-        data_dic = unpickle(path+"cifar-10-batches-py/data_batch_{}".format(i))
-        if i == 1:
-            X_train = data_dic['data']
+    def to_shape(data):
+        # each row of data is the 1024 red, then green, then blue values of
+        # an image, in row-major order
+        if shape == (-1, 32, 32, 3):
+            return data.reshape(-1, 3, 32, 32).transpose(0, 2, 3, 1)
         else:
-            X_train = np.vstack((X_train, data_dic['data']))
-        y_train += data_dic['labels']
-
-    test_data_dic = unpickle(path+"cifar-10-batches-py/test_batch")
-    X_test = test_data_dic['data']
-    y_test = np.array(test_data_dic['labels'])
-
-    if shape == (-1, 3, 32, 32):
-        X_test = X_test.reshape(shape)
-        X_train = X_train.reshape(shape)
-        # X_train = np.transpose(X_train, (0, 1, 3, 2))
-    elif shape == (-1, 32, 32, 3):
-        X_test = X_test.reshape(shape, order='F')
-        X_train = X_train.reshape(shape, order='F')
-        X_test = np.transpose(X_test, (0, 2, 1, 3))
-        X_train = np.transpose(X_train, (0, 2, 1, 3))
+            return data.reshape((-1,) + tuple(shape[1:]))
+
+    def load_all():
+        # each batch file has 10000 images, they are decoded in parallel
+        # straight into the preallocated arrays
+        n_batch = 10000
+        X_train = np.empty((5 * n_batch,) + to_shape(np.empty((1, 3072), np.uint8)).shape[1:], dtype=dtype)
+        y_train = np.empty((5 * n_batch,), dtype=np.int32)
+        X_test = np.empty((n_batch,) + X_train.shape[1:], dtype=dtype)
+        y_test = np.empty((n_batch,), dtype=np.int32)
+
+        def load_batch(i):
+            if i < 6:
+                data_dic = unpickle(os.path.join(path, "cifar-10-batches-py", "data_batch_{}".format(i)))
+                X, y = X_train[(i-1) * n_batch:i * n_batch], y_train[(i-1) * n_batch:i * n_batch]
+            else:
+                data_dic = unpickle(os.path.join(path, "cifar-10-batches-py", "test_batch"))
+                X, y = X_test, y_test
+            X[...] = to_shape(data_dic['data'])
+            y[...] = data_dic['labels']
+
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(6)
+        pool.map(load_batch, range(1, 7))
+        pool.close()
+        pool.join()
+        return X_train, y_train, X_test, y_test
+
+    if cache_dir is None:
+        X_train, y_train, X_test, y_test = load_all()
     else:
-        X_test = X_test.reshape(shape)
-        X_train = X_train.reshape(shape)
-
-    y_train = np.array(y_train)
+        sources = [os.path.join(path, "cifar-10-batches-py", "data_batch_{}".format(i)) for i in range(1,6)]
+        sources.append(os.path.join(path, "cifar-10-batches-py", "test_batch"))
+        # the memory layout depends on the shape
+        name = 'cifar10_' + '_'.join(str(d) for d in shape) + '_' + np.dtype(dtype).name
+        X_train, y_train, X_test, y_test = _load_cached_arrays(cache_dir, name, sources,
+                                    ['X_train', 'y_train', 'X_test', 'y_test'], load_all)
 
     if plotable == True:
         print('\nCIFAR-10')
@@ -238,10 +276,10 @@ def load_cifar10_dataset(shape=(-1, 32, 32, 3), plotable=False, second=3):
                 a = fig.add_subplot(10, 10, count)
                 if shape == (-1, 3, 32, 32):
                     # plt.imshow(X_train[count-1], interpolation='nearest')
-                    plt.imshow(np.transpose(X_train[count-1], (1, 2, 0)), interpolation='nearest')
+                    plt.imshow(np.transpose(np.asarray(X_train[count-1], dtype=np.uint8), (1, 2, 0)), interpolation='nearest')
                     # plt.imshow(np.transpose(X_train[count-1], (2, 1, 0)), interpolation='nearest')
                 elif shape == (-1, 32, 32, 3):
-                    plt.imshow(X_train[count-1], interpolation='nearest')
+                    plt.imshow(np.asarray(X_train[count-1], dtype=np.uint8), interpolation='nearest')
                     # plt.imshow(np.transpose(X_train[count-1], (1, 0, 2)), interpolation='nearest')
                 else:
                     raise Exception("Do not support the given 'shape' to plot the image examples")
@@ -256,11 +294,6 @@ def load_cifar10_dataset(shape=(-1, 32, 32, 3), plotable=False, second=3):
         print("X_test:",X_test.shape)
         print("y_test:",y_test.shape)
 
-    X_train = np.asarray(X_train, dtype=np.float32)
-    X_test = np.asarray(X_test, dtype=np.float32)
-    y_train = np.asarray(y_train, dtype=np.int32)
-    y_test = np.asarray(y_test, dtype=np.int32)
-
     return X_train, y_train, X_test, y_test
 
 def load_ptb_dataset():
@@ -300,33 +333,13 @@ def load_ptb_dataset():
     ---------------
     `Manual download <http://www.fit.vutbr.cz/~imikolov/rnnlm/simple-examples.tgz>`_
     """
-    # We first define a download function, supporting both Python 2 and 3.
-    filename = 'simple-examples.tgz'
-    if sys.version_info[0] == 2:
-        from urllib import urlretrieve
-    else:
-        from urllib.request import urlretrieve
-
-    def download(filename, source='http://www.fit.vutbr.cz/~imikolov/rnnlm/'):
-        print("Downloading %s" % filename)
-        urlretrieve(source + filename, filename)
-
-    # After downloading, we need to unzip it.
-    import tarfile
-    def un_tar(file_name):
-        print("Extracting %s" % file_name)
-        tar = tarfile.open(file_name)
-        names = tar.getnames()
-        for name in names:
-            tar.extract(name)
-        tar.close()
-        print("Extracted to /simple-examples")
-
-    if not os.path.exists('simple-examples'):
-        download(filename)
-        un_tar(filename)
-
-    data_path = os.getcwd() + '/simple-examples/data'
+    # Download the simple-examples.tgz, and unzip it.
+    path = _data_config['data_dir']
+    maybe_download_and_extract('simple-examples.tgz', path,
+                        'http://www.fit.vutbr.cz/~imikolov/rnnlm/', extract=True, extract_dir='simple-examples',
+                        sha256=_dataset_sha256.get('simple-examples.tgz'))
+
+    data_path = os.path.join(path, 'simple-examples', 'data')
     train_path = os.path.join(data_path, "ptb.train.txt")
     valid_path = os.path.join(data_path, "ptb.valid.txt")
     test_path = os.path.join(data_path, "ptb.test.txt")
@@ -363,26 +376,10 @@ def load_matt_mahoney_text8_dataset():
     >>> print('Data size', len(words))
     """
     import zipfile
-    from six.moves import urllib
-
-    url = 'http://mattmahoney.net/dc/'
-
-    def download_matt_mahoney_text8(filename, expected_bytes):
-      """Download a text file from Matt Mahoney's website
-      if not present, and make sure it's the right size."""
-      if not os.path.exists(filename):
-        print('Downloading ...')
-        filename, _ = urllib.request.urlretrieve(url + filename, filename)
-      statinfo = os.stat(filename)
-      if statinfo.st_size == expected_bytes:
-        print('Found and verified', filename)
-      else:
-        print(statinfo.st_size)
-        raise Exception(
-            'Failed to verify ' + filename + '. Can you get to it with a browser?')
-      return filename
-
-    filename = download_matt_mahoney_text8('text8.zip', 31344016)
+
+    filename = maybe_download_and_extract('text8.zip', _data_config['data_dir'],
+                        'http://mattmahoney.net/dc/', expected_bytes=31344016,
+                        sha256=_dataset_sha256.get('text8.zip'))
 
     with zipfile.ZipFile(filename) as f:
         word_list = f.read(f.namelist()[0]).split()
@@ -390,9 +387,22 @@ def load_matt_mahoney_text8_dataset():
 
 def load_imbd_dataset(path="imdb.pkl", nb_words=None, skip_top=0,
               maxlen=None, test_split=0.2, seed=113,
-              start_char=1, oov_char=2, index_from=3):
+              start_char=1, oov_char=2, index_from=3, ragged=False):
     """Load IMDB dataset
 
+    The sequences are kept as one flat int32 array of word IDs and an offsets
+    array, the i-th sequence is ``tokens[offsets[i]:offsets[i+1]]``, and all the
+    index shifting, maxlen filtering and out-of-vocabulary replacement are
+    vectorized over the flat array.
+
+    Parameters
+    ----------
+    ragged : boolean
+        If False, X_train and X_test are object arrays of lists as before.
+        If True, they are (tokens, offsets) tuples, which take 4 bytes per
+        word, use :func:`tensorlayer.iterate.ragged_padded_batch` to build the
+        padded batches.
+
     Examples
     --------
     >>> X_train, y_train, X_test, y_test = tl.files.load_imbd_dataset(
@@ -401,6 +411,10 @@ def load_imbd_dataset(path="imdb.pkl", nb_words=None, skip_top=0,
     ... (20000,)  [[1, 62, 74, ... 1033, 507, 27],[1, 60, 33, ... 13, 1053, 7]..]
     >>> print('y_train.shape', y_train.shape)
     ... (20000,)  [1 0 0 ..., 1 0 1]
+    ...
+    >>> (tokens, offsets), y_train, X_test, y_test = tl.files.load_imbd_dataset(
+    ...                                 nb_words=20000, test_split=0.2, ragged=True)
+    >>> X_a = tl.iterate.ragged_padded_batch(tokens, offsets, excerpt=[0, 1, 2], maxlen=400)
 
     References
     -----------
@@ -409,18 +423,11 @@ def load_imbd_dataset(path="imdb.pkl", nb_words=None, skip_top=0,
     from six.moves import cPickle
     import gzip
     # from ..utils.data_utils import get_file
-    from six.moves import zip
+    import itertools
     import numpy as np
-    from six.moves import urllib
-
-    url = 'https://s3.amazonaws.com/text-datasets/'
-    def download_imbd(filename):
-      if not os.path.exists(filename):
-        print('Downloading ...')
-        filename, _ = urllib.request.urlretrieve(url + filename, filename)
-      return filename
 
-    filename = download_imbd(path)
+    filename = maybe_download_and_extract(path, _data_config['data_dir'],
+                        'https://s3.amazonaws.com/text-datasets/', sha256=_dataset_sha256.get(path))
     # path = get_file(path, origin="https://s3.amazonaws.com/text-datasets/imdb.pkl")
 
     if filename.endswith(".gz"):
@@ -431,77 +438,326 @@ def load_imbd_dataset(path="imdb.pkl", nb_words=None, skip_top=0,
     X, labels = cPickle.load(f)
     f.close()
 
+    # flat word IDs and offsets, the only pass over the Python lists
+    lengths = np.fromiter((len(x) for x in X), dtype=np.int64, count=len(X))
+    tokens = np.fromiter(itertools.chain.from_iterable(X), dtype=np.int64, count=int(lengths.sum()))
+    offsets = np.concatenate(([0], np.cumsum(lengths)))
+    labels = np.asarray(labels)
+    del X
+
+    # the same permutation as np.random.shuffle on the lists
+    perm = np.arange(len(lengths))
     np.random.seed(seed)
-    np.random.shuffle(X)
-    np.random.seed(seed)
-    np.random.shuffle(labels)
+    np.random.shuffle(perm)
+    tokens, offsets = _ragged_take(tokens, offsets, perm)
+    labels = labels[perm]
 
     if start_char is not None:
-        X = [[start_char] + [w + index_from for w in x] for x in X]
+        # insert start_char before each sequence
+        lengths = np.diff(offsets) + 1
+        new_offsets = np.concatenate(([0], np.cumsum(lengths)))
+        is_start = np.zeros(new_offsets[-1], dtype=bool)
+        is_start[new_offsets[:-1]] = True
+        new_tokens = np.empty(new_offsets[-1], dtype=np.int64)
+        new_tokens[is_start] = start_char
+        new_tokens[~is_start] = tokens + index_from
+        tokens, offsets = new_tokens, new_offsets
     elif index_from:
-        X = [[w + index_from for w in x] for x in X]
+        tokens = tokens + index_from
 
     if maxlen:
-        new_X = []
-        new_labels = []
-        for x, y in zip(X, labels):
-            if len(x) < maxlen:
-                new_X.append(x)
-                new_labels.append(y)
-        X = new_X
-        labels = new_labels
-    if not X:
+        keep = np.where(np.diff(offsets) < maxlen)[0]
+        tokens, offsets = _ragged_take(tokens, offsets, keep)
+        labels = labels[keep]
+    if len(offsets) == 1:
         raise Exception('After filtering for sequences shorter than maxlen=' +
                         str(maxlen) + ', no sequence was kept. '
                         'Increase maxlen.')
     if not nb_words:
-        nb_words = max([max(x) for x in X])
+        nb_words = tokens.max()
 
     # by convention, use 2 as OOV word
     # reserve 'index_from' (=3 by default) characters: 0 (padding), 1 (start), 2 (OOV)
+    oov = (tokens >= nb_words) | (tokens < skip_top)
     if oov_char is not None:
-        X = [[oov_char if (w >= nb_words or w < skip_top) else w for w in x] for x in X]
+        tokens[oov] = oov_char
     else:
-        nX = []
-        for x in X:
-            nx = []
-            for w in x:
-                if (w >= nb_words or w < skip_top):
-                    nx.append(w)
-            nX.append(nx)
-        X = nX
-
-    X_train = np.array(X[:int(len(X) * (1 - test_split))])
-    y_train = np.array(labels[:int(len(X) * (1 - test_split))])
-
-    X_test = np.array(X[int(len(X) * (1 - test_split)):])
-    y_test = np.array(labels[int(len(X) * (1 - test_split)):])
-
+        # remove the OOV words
+        sequence_ids = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+        lengths = np.bincount(sequence_ids[~oov], minlength=len(offsets) - 1)
+        tokens = tokens[~oov]
+        offsets = np.concatenate(([0], np.cumsum(lengths)))
+    tokens = tokens.astype(np.int32)
+
+    n_train = int((len(offsets) - 1) * (1 - test_split))
+    X_train = _ragged_take(tokens, offsets, np.arange(n_train))
+    X_test = _ragged_take(tokens, offsets, np.arange(n_train, len(offsets) - 1))
+    y_train = labels[:n_train]
+    y_test = labels[n_train:]
+
+    if not ragged:
+        X_train = _ragged_to_lists(*X_train)
+        X_test = _ragged_to_lists(*X_test)
     return X_train, y_train, X_test, y_test
 
+def _ragged_take(tokens, offsets, indices):
+    """Return the (tokens, offsets) of the sequences ``indices`` of a ragged
+    array, in the order of ``indices``.
+    """
+    indices = np.asarray(indices, dtype=np.int64)
+    lengths = offsets[indices + 1] - offsets[indices]
+    new_offsets = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+    # position of each new word in the old flat array
+    shift = np.repeat(offsets[indices] - new_offsets[:-1], lengths)
+    return tokens[np.arange(new_offsets[-1]) + shift], new_offsets
+
+def _ragged_to_lists(tokens, offsets):
+    """Return a ragged array as an object array of lists."""
+    X = np.empty(len(offsets) - 1, dtype=object)
+    for i in range(len(X)):
+        X[i] = tokens[offsets[i]:offsets[i + 1]].tolist()
+    return X
+
 def load_nietzsche_dataset():
     """Load Nietzsche dataset
     """
-    if sys.version_info[0] == 2:
-        from urllib import urlretrieve
-    else:
-        from urllib.request import urlretrieve
-
-    def download(filename, source='https://s3.amazonaws.com/text-datasets/'):
-        print("Downloading %s" % filename)
-        urlretrieve(source + filename, filename)
-
-    if not os.path.exists("nietzsche.txt"):
-        download("nietzsche.txt")
+    filename = maybe_download_and_extract("nietzsche.txt", _data_config['data_dir'],
+                        'https://s3.amazonaws.com/text-datasets/', sha256=_dataset_sha256.get('nietzsche.txt'))
 
     # return read_words("nietzsche.txt", replace = ['', ''])
     # with tf.gfile.GFile("nietzsche.txt", "r") as f:
     #     return f.read()
-    with open("nietzsche.txt", "r") as f:
+    with open(filename, "r") as f:
         words = f.read()
         return words
 
 
+## Download functions
+def set_data_dir(data_dir='', mirror=None):
+    """Set the folder where the load_*_dataset functions download and read
+    the datasets (the current directory by default), and an optional mirror
+    which is tried before the original website.
+
+    Parameters
+    ----------
+    data_dir : a string
+        The folder of the datasets, shared by all loaders.
+    mirror : a string or None
+        A local folder or a base URL (e.g. 'http://10.0.0.1/datasets/') which
+        has the dataset files under their original file names.
+
+    Examples
+    --------
+    >>> tl.files.set_data_dir('/data/tensorlayer', mirror='http://10.0.0.1/datasets/')
+    >>> X_train, y_train, X_val, y_val, X_test, y_test = tl.files.load_mnist_dataset()
+    """
+    _data_config['data_dir'] = data_dir
+    _data_config['mirror'] = mirror
+
+def maybe_download_and_extract(filename, working_directory, url_source, extract=False,
+                                expected_bytes=None, sha256=None, n_threads=4, extract_dir=None):
+    """Download ``url_source + filename`` into ``working_directory`` if the
+    file is not there yet, and return its path.
+
+    When the server supports range requests, the file is downloaded in
+    ``n_threads`` parts in parallel, each part is kept in a ``.part`` file so an
+    interrupted download resumes where it stopped, the ETag (or Last-Modified)
+    of the file is kept next to the parts, and sent in an If-Range header, so the
+    parts of a file which changed on the server are dropped instead of being
+    joined with the new file. The parts are joined into a
+    temporary file, which is verified and then renamed to ``filename``, so a
+    partial file never has the final name. If a mirror is set by
+    :func:`set_data_dir`, it is tried before ``url_source``.
+
+    Parameters
+    ----------
+    filename : a string
+        The name of the file, both on the server and on disk.
+    working_directory : a string
+        The folder to save the file into, it is created if needed.
+    url_source : a string
+        The URL of the folder of the file on the server.
+    extract : boolean
+        If True, extract the (tar or zip) file into working_directory, also when
+        the file was downloaded before, unless extract_dir exists.
+    expected_bytes : int or None
+        If given, the size the file must have.
+    sha256 : a string or None
+        If given, the SHA-256 hex digest the downloaded file must have.
+    n_threads : int
+        The maximum number of parallel range requests.
+    extract_dir : a string or None
+        The file or folder (in working_directory) the archive extracts to,
+        if it exists the archive is not extracted again.
+
+    Examples
+    --------
+    >>> filepath = tl.files.maybe_download_and_extract('text8.zip', 'data',
+    ...                 'http://mattmahoney.net/dc/', expected_bytes=31344016)
+    """
+    filepath = os.path.join(working_directory, filename)
+    if os.path.exists(filepath):
+        if expected_bytes is not None and os.path.getsize(filepath) != expected_bytes:
+            raise Exception('Failed to verify %s, size %d != %d. Delete it to download again.'
+                                % (filepath, os.path.getsize(filepath), expected_bytes))
+    else:
+        _download_and_verify(filename, working_directory, url_source, expected_bytes, sha256, n_threads)
+
+    if extract and (extract_dir is None or not os.path.exists(os.path.join(working_directory, extract_dir))):
+        print("Extracting %s" % filepath)
+        if filepath.endswith('.zip'):
+            import zipfile
+            with zipfile.ZipFile(filepath) as zf:
+                zf.extractall(working_directory or '.')
+        else:
+            import tarfile
+            tar = tarfile.open(filepath)
+            tar.extractall(working_directory or '.')
+            tar.close()
+    return filepath
+
+def _download_and_verify(filename, working_directory, url_source, expected_bytes=None, sha256=None, n_threads=4):
+    """Download filename as maybe_download_and_extract() describes."""
+    filepath = os.path.join(working_directory, filename)
+    if working_directory and not os.path.exists(working_directory):
+        os.makedirs(working_directory)
+
+    print("Downloading %s" % filename)
+    mirror = _data_config['mirror']
+    tmp_file = filepath + '.tmp'
+    if mirror is not None and os.path.isdir(mirror) and os.path.exists(os.path.join(mirror, filename)):
+        shutil.copyfile(os.path.join(mirror, filename), tmp_file)
+    else:
+        urls = [url_source + filename]
+        if mirror is not None and not os.path.isdir(mirror):
+            urls.insert(0, mirror + filename)
+        for k, url in enumerate(urls):
+            try:
+                _download(url, filepath, tmp_file, n_threads)
+                break
+            except Exception as e:
+                if k == len(urls) - 1:
+                    raise
+                print("Failed to download %s (%s), try %s" % (url, e, urls[k + 1]))
+
+    if expected_bytes is not None and os.path.getsize(tmp_file) != expected_bytes:
+        os.remove(tmp_file)
+        raise Exception('Failed to verify %s, size != %d. Can you get to it with a browser?'
+                            % (filename, expected_bytes))
+    if sha256 is not None and _file_checksum(tmp_file) != sha256:
+        os.remove(tmp_file)
+        raise Exception('Failed to verify %s, SHA-256 != %s. Can you get to it with a browser?'
+                            % (filename, sha256))
+    _replace_file(tmp_file, filepath)
+    print('Found and verified %s' % filepath)
+
+def _download(url, filepath, tmp_file, n_threads=4, min_part_size=1 << 20):
+    """Download url into tmp_file, by parallel and resumable range requests
+    if the server supports them, otherwise by a single request.
+    """
+    size, validator, response = _remote_info(url)
+    if size is None:
+        # the server does not support range requests, response is the whole file
+        if response is None:
+            response = urllib.request.urlopen(url)
+        try:
+            with open(tmp_file, 'wb') as f:
+                shutil.copyfileobj(response, f, 1 << 16)
+        finally:
+            response.close()
+        return
+    # the parts of a previous download are kept only if the file did not change since
+    parts_info_file = filepath + '.parts.json'
+    parts_info = {'url': url, 'size': size, 'validator': validator}
+    old_parts_info = None
+    if os.path.exists(parts_info_file):
+        with open(parts_info_file) as f:
+            old_parts_info = json.load(f)
+    if old_parts_info != parts_info or validator is None:
+        _remove_parts(filepath)
+        _write_json(parts_info, parts_info_file)
+    n_parts = int(max(1, min(n_threads, size // min_part_size)))
+    part_size = -(-size // n_parts)
+    parts = []
+    for k in range(n_parts):
+        part_file = '%s.part%d-of-%d' % (filepath, k, n_parts)
+        parts.append((part_file, k * part_size, min(size, (k + 1) * part_size) - 1))
+    errors = []
+    def download_part(part_file, start, end):
+        try:
+            _download_range(url, part_file, start, end, validator)
+        except Exception as e:
+            errors.append(e)
+    threads = [threading.Thread(target=download_part, args=part) for part in parts]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    if errors:
+        if any(isinstance(e, _RemoteFileChanged) for e in errors):
+            _remove_parts(filepath)
+        raise errors[0]
+    with open(tmp_file, 'wb') as f:
+        for part_file, _, _ in parts:
+            with open(part_file, 'rb') as pf:
+                shutil.copyfileobj(pf, f, 1 << 20)
+    if os.path.getsize(tmp_file) != size:
+        os.remove(tmp_file)
+        raise Exception('Downloaded %s has the wrong size' % url)
+    _remove_parts(filepath)
+
+class _RemoteFileChanged(Exception):
+    pass
+
+def _remove_parts(filepath):
+    """Remove the part files of a download of filepath, and their info file."""
+    folder = os.path.dirname(filepath) or '.'
+    prefix = os.path.basename(filepath)
+    for name in os.listdir(folder):
+        if re.match(re.escape(prefix) + r'\.part\d+-of-\d+$', name) or name == prefix + '.parts.json':
+            os.remove(os.path.join(folder, name))
+
+def _remote_info(url):
+    """Return the size of the file at url and its ETag or Last-Modified (or
+    None) if the server supports range requests. Otherwise return None, None
+    and the open response of the whole file, which the server sent instead of
+    the first byte, or None if url is not HTTP.
+    """
+    if not url.startswith('http'):
+        return None, None, None
+    request = urllib.request.Request(url, headers={'Range': 'bytes=0-0'})
+    response = urllib.request.urlopen(request)
+    info = response.info()
+    content_range = info.get('Content-Range')
+    if response.getcode() == 206 and content_range:
+        response.close()
+        return int(content_range.split('/')[-1]), info.get('ETag') or info.get('Last-Modified'), None
+    return None, None, response
+
+def _download_range(url, part_file, start, end, validator=None):
+    """Download the bytes [start, end] of url into part_file, resume from
+    the bytes already in part_file. With a validator (ETag or Last-Modified),
+    the request has an If-Range header, and _RemoteFileChanged is raised if
+    the server sends the whole file because it changed.
+    """
+    done = os.path.getsize(part_file) if os.path.exists(part_file) else 0
+    if start + done > end:
+        return
+    headers = {'Range': 'bytes=%d-%d' % (start + done, end)}
+    if validator is not None:
+        headers['If-Range'] = validator
+    request = urllib.request.Request(url, headers=headers)
+    response = urllib.request.urlopen(request)
+    try:
+        if response.getcode() != 206:
+            if validator is not None:
+                raise _RemoteFileChanged('%s changed on the server during the download, download it again' % url)
+            raise Exception('The server ignored the range request of %s' % url)
+        with open(part_file, 'ab') as f:
+            shutil.copyfileobj(response, f, 1 << 16)
+    finally:
+        response.close()
+
 ## Vector representations of words
 def read_words(filename, replace = ['\n', '<eos>']):
     """File to list format context.
@@ -632,6 +888,189 @@ def build_vocab(data):
     # print(word_to_id) # dictionary for word to id, e.g. 'campbell': 2587, 'atlantic': 2247, 'aoun': 6746
     return word_to_id
 
+def count_words(filename, member=None, replace=['\n', '<eos>'], encoding='utf-8',
+                n_workers=4, chunk_size=1 << 24):
+    """Count the words of a text file (or of a member of a zip file) without
+    reading it into memory, the file is read in chunks which are split into
+    words and counted by ``n_workers`` processes, then the counts are merged.
+    The memory is proportional to the vocabulary size, not to the file size.
+
+    The words are the same as :func:`read_words` returns.
+
+    Parameters
+    ----------
+    filename : a string
+        A file path (like .txt file), or a .zip file path if member is given.
+    member : a string or None
+        The name of the file in the zip file.
+    replace : a list
+        [original string, target string], to disable replace use ['', ''].
+    encoding : a string or None
+        The encoding of the file, the words are bytes if None.
+    n_workers : int
+        The number of worker processes, 1 to count in this process.
+    chunk_size : int
+        The number of bytes read at a time.
+
+    Returns
+    --------
+    counter : collections.Counter
+        The occurrence number of each word.
+
+    Examples
+    --------
+    >>> counter = tl.files.count_words('simple-examples/data/ptb.train.txt')
+    >>> word_to_id = tl.files.build_vocab(counter)
+    ...
+    >>> For text8, the words are bytes as load_matt_mahoney_text8_dataset() returns
+    >>> counter = tl.files.count_words('text8.zip', member='text8', replace=['', ''], encoding=None)
+    >>> count = [['UNK', -1]] + counter.most_common(vocabulary_size - 1)
+    >>> dictionary = dict((word, i) for i, (word, _) in enumerate(count))
+    """
+    counter = collections.Counter()
+    chunks = _iter_text_chunks(filename, member, replace, encoding, chunk_size)
+    for chunk_counter in _map_chunks(_count_chunk, chunks, n_workers):
+        counter.update(chunk_counter)
+    return counter
+
+def words_file_to_word_ids(filename, word_to_id, member=None, replace=['\n', '<eos>'],
+                            encoding='utf-8', unk_id=None, out_file=None,
+                            n_workers=4, chunk_size=1 << 24):
+    """Convert the words of a text file (or of a member of a zip file) to an
+    int32 array of IDs without building the list of words, the file is read
+    in chunks which are converted by ``n_workers`` processes.
+
+    Parameters
+    ----------
+    filename : a string
+        A file path (like .txt file), or a .zip file path if member is given.
+    word_to_id : a dictionary
+        mapping words to unique IDs, e.g. from :func:`build_vocab`.
+    member : a string or None
+        The name of the file in the zip file.
+    replace : a list
+        [original string, target string], see :func:`count_words`.
+    encoding : a string or None
+        The encoding of the file, the words are bytes if None.
+    unk_id : int or None
+        The ID of the words which are not in word_to_id, raise KeyError if None.
+    out_file : a string or None
+        If given, the IDs are written into this raw int32 file and a read-only
+        np.memmap of it is returned, so the IDs never have to fit in memory.
+        It can be given to :func:`tensorlayer.iterate.ptb_iterator` directly.
+    n_workers : int
+        The number of worker processes, 1 to convert in this process.
+    chunk_size : int
+        The number of bytes read at a time.
+
+    Returns
+    --------
+    ids : numpy.array or np.memmap
+        The int32 IDs of the words.
+
+    Examples
+    --------
+    >>> counter = tl.files.count_words(train_path)
+    >>> word_to_id = tl.files.build_vocab(counter)
+    >>> train_data = tl.files.words_file_to_word_ids(train_path, word_to_id, out_file='ptb.train.bin')
+    >>> for x, y in tl.iterate.ptb_iterator('ptb.train.bin', batch_size, num_steps):
+    >>>     ...
+    """
+    chunks = _iter_text_chunks(filename, member, replace, encoding, chunk_size)
+    ids = _map_chunks(_chunk_to_word_ids, chunks, n_workers,
+                        initializer=_init_word_ids_worker, initargs=(word_to_id, unk_id))
+    if out_file is None:
+        return np.concatenate([np.zeros(0, dtype=np.int32)] + list(ids))
+    with _atomic_write(out_file) as f:
+        for chunk_ids in ids:
+            chunk_ids.tofile(f)
+    return np.memmap(out_file, dtype=np.int32, mode='r')
+
+def _iter_text_chunks(filename, member=None, replace=['\n', '<eos>'], encoding='utf-8', chunk_size=1 << 24):
+    """Yield the text of a file in chunks of about chunk_size bytes, cut at
+    whitespace so no word is split, with replace applied. The last
+    len(original) - 1 bytes of a read are replaced together with the next
+    read, so an original which spans two reads is replaced too.
+    """
+    import zipfile
+    whitespace = [b' ', b'\n', b'\t', b'\r', b'\x0b', b'\x0c']
+    codec = encoding or 'utf-8'
+    original, target = replace[0].encode(codec), replace[1].encode(codec)
+    if member is None:
+        zf, f = None, open(filename, 'rb')
+    else:
+        zf = zipfile.ZipFile(filename)
+        f = zf.open(member)
+    try:
+        rest, pending = b'', b''
+        while True:
+            data = f.read(chunk_size)
+            raw = pending + data
+            safe = len(raw)
+            if data and len(original) > 1:
+                # hold back the bytes which may start an original ending in the next read,
+                # and the last original found by replace() if it is among them
+                safe = len(raw) - len(original) + 1
+                last_end = len(raw) - len(raw.split(original)[-1]) if original in raw else 0
+                if last_end > safe:
+                    safe = last_end - len(original)
+            raw, pending = raw[:safe], raw[safe:]
+            if original:
+                raw = raw.replace(original, target)
+            chunk = rest + raw
+            if data:
+                cut = max(chunk.rfind(w) for w in whitespace) + 1
+                chunk, rest = chunk[:cut], chunk[cut:]
+            if chunk:
+                yield chunk.decode(encoding) if encoding is not None else chunk
+            if not data:
+                break
+    finally:
+        f.close()
+        if zf is not None:
+            zf.close()
+
+def _map_chunks(func, chunks, n_workers, initializer=None, initargs=()):
+    """Yield func(chunk) for each chunk in order, computed by n_workers
+    processes with at most 2 * n_workers chunks in flight.
+    """
+    if n_workers <= 1:
+        if initializer is not None:
+            initializer(*initargs)
+        for chunk in chunks:
+            yield func(chunk)
+        return
+    pool = multiprocessing.Pool(n_workers, initializer, initargs)
+    try:
+        pending = collections.deque()
+        for chunk in chunks:
+            pending.append(pool.apply_async(func, (chunk,)))
+            if len(pending) >= 2 * n_workers:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+    finally:
+        pool.terminate()
+        pool.join()
+
+def _count_chunk(chunk):
+    return collections.Counter(chunk.split())
+
+_word_ids_worker = {}
+
+def _init_word_ids_worker(word_to_id, unk_id):
+    _word_ids_worker['word_to_id'] = word_to_id
+    _word_ids_worker['unk_id'] = unk_id
+
+def _chunk_to_word_ids(chunk):
+    word_to_id = _word_ids_worker['word_to_id']
+    unk_id = _word_ids_worker['unk_id']
+    if unk_id is None:
+        ids = [word_to_id[word] for word in chunk.split()]
+    else:
+        ids = [word_to_id.get(word, unk_id) for word in chunk.split()]
+    return np.array(ids, dtype=np.int32)
+
 def build_reverse_dictionary(word_to_id):
     """Given a dictionary for converting word to integer id.
     Returns a reverse dictionary for converting a id to word.
@@ -773,6 +1212,194 @@ def word_ids_to_words(data, id_to_word):
     """
     return [id_to_word[i] for i in data]
 
+class Vocabulary(object):
+    """A vocabulary stored in a few NumPy arrays instead of two dictionaries,
+    which converts arrays of words to int32 arrays of IDs and back.
+    Use :func:`build_vocabulary` to create it and :func:`load_vocabulary` to
+    memory-map a saved one.
+
+    The words are kept in one sorted string array (str or bytes, as given),
+    encoding an array is a binary search in it, encoding a list is a lookup in
+    a dictionary built at the first use, and decoding is an array lookup.
+
+    Parameters
+    ----------
+    sorted_words : numpy.array of string or byte
+        The words, in ascending order.
+    sorted_ids : numpy.array of int32
+        The ID of each word in sorted_words.
+    counts : numpy.array of int64
+        The occurrence number of each ID, the count of UNK includes the removed words.
+    unk_id : int or None
+        The ID used for the words which are not in the vocabulary, None if there is no UNK.
+    positions : numpy.array of int32 or None
+        The position of each ID in sorted_words, computed if None.
+
+    Field (Class Variables)
+    -----------------------
+    unk_id : int or None
+        The ID of UNK.
+    counts : numpy.array of int64
+        The occurrence number of each ID.
+
+    Examples
+    --------
+    >>> words = tl.files.load_matt_mahoney_text8_dataset()
+    >>> vocab = tl.files.build_vocabulary(words, vocabulary_size=50000)
+    >>> data = vocab.encode(words)
+    >>> print(vocab.encode([b'hello', b'how', b'are', b'you']))
+    ... [6434  311   26  207]
+    >>> print(vocab.decode(data[:4]))
+    ... [b'anarchism' b'originated' b'as' b'a']
+    >>> vocab.save('vocab_text8.bin')
+    >>> vocab = tl.files.load_vocabulary('vocab_text8.bin')
+    """
+    def __init__(
+        self,
+        sorted_words,
+        sorted_ids,
+        counts,
+        unk_id = None,
+        positions = None,
+    ):
+        self.sorted_words = sorted_words
+        self.sorted_ids = sorted_ids
+        self.counts = counts
+        self.unk_id = unk_id
+        if positions is None:
+            positions = np.empty(len(sorted_ids), dtype=np.int32)
+            positions[sorted_ids] = np.arange(len(sorted_ids), dtype=np.int32)
+        self.positions = positions
+        self._word_to_id = None
+
+    def __len__(self):
+        return len(self.sorted_ids)
+
+    def __contains__(self, word):
+        return bool(self._find(np.asarray([word]))[1][0])
+
+    def _find(self, words):
+        """Return the positions of words in sorted_words and whether they are found."""
+        if len(self.sorted_words) == 0:
+            return np.zeros(words.shape, dtype=np.intp), np.zeros(words.shape, dtype=bool)
+        pos = np.searchsorted(self.sorted_words, words)
+        np.minimum(pos, len(self.sorted_words) - 1, out=pos)
+        return pos, self.sorted_words[pos] == words
+
+    def encode(self, words, out=None):
+        """Return the int32 IDs of an array (or list) of words, with the same shape.
+        The words which are not in the vocabulary get unk_id, or raise KeyError if there is no UNK.
+        """
+        if not isinstance(words, np.ndarray):
+            return self._encode_list(words, out)
+        pos, found = self._find(words)
+        ids = np.take(self.sorted_ids, pos, out=out)
+        if not found.all():
+            if self.unk_id is None:
+                raise KeyError(words[~found].flat[0])
+            ids[~found] = self.unk_id
+        return ids
+
+    def _encode_list(self, words, out=None):
+        """Encode a list of words by a dictionary lookup, which is faster than
+        converting the list to an array and searching it.
+        """
+        if self._word_to_id is None:
+            self._word_to_id = dict(zip(self.sorted_words.tolist(), self.sorted_ids.tolist()))
+        get = self._word_to_id.get
+        missing = -1 if self.unk_id is None else self.unk_id
+        if len(words) > 0 and isinstance(words[0], (list, tuple)):
+            ids = np.array([[get(w, missing) for w in row] for row in words], dtype=np.int32)
+        else:
+            ids = np.fromiter(six.moves.map(get, words, itertools.repeat(missing, len(words))),
+                                dtype=np.int32, count=len(words))
+        if self.unk_id is None and (ids < 0).any():
+            raise KeyError(np.asarray(words)[ids < 0].flat[0])
+        if out is not None:
+            out[...] = ids
+            return out
+        return ids
+
+    def decode(self, ids):
+        """Return the words of an array (or list) of IDs, with the same shape."""
+        return self.sorted_words[self.positions[np.asarray(ids)]]
+
+    def save(self, name='vocab.bin'):
+        """Save the vocabulary to a binary file which :func:`load_vocabulary` memory-maps."""
+        _write_array_file(name, [
+            ('sorted_words', self.sorted_words),
+            ('sorted_ids', self.sorted_ids),
+            ('positions', self.positions),
+            ('counts', self.counts),
+            ('unk_id', np.array([-1 if self.unk_id is None else self.unk_id], dtype=np.int64)),
+        ])
+
+def build_vocabulary(words, vocabulary_size=None, min_count=1, unk_word='UNK'):
+    """Build a :class:`Vocabulary` from a list (or array) of words, or from a
+    dictionary of word counts such as :func:`count_words` returns.
+    Like :func:`build_words_dataset`, UNK has ID 0 and the most common word has
+    the smallest ID after it, words with the same count are in ascending order.
+
+    Parameters
+    ----------
+    words : a list of string or byte, or a dictionary
+        The context in list format, or the occurrence number of each word.
+    vocabulary_size : an int or None
+        The maximum vocabulary size, including UNK.
+    min_count : an int
+        The words which occur less than min_count times are replaced with UNK.
+    unk_word : a string or None
+        The word of UNK, if it occurs in words its count is added to UNK.
+        If None, there is no UNK, the words cut by vocabulary_size and min_count
+        are left out, and encoding them raises KeyError.
+
+    Examples
+    --------
+    >>> vocab = tl.files.build_vocabulary(words, vocabulary_size=50000, min_count=5)
+    >>> counter = tl.files.count_words('text8.zip', member='text8', replace=['', ''], encoding=None)
+    >>> vocab = tl.files.build_vocabulary(counter, vocabulary_size=50000)
+    """
+    if isinstance(words, dict):
+        unique_words = np.asarray(list(words.keys()))
+        counts = np.asarray(list(words.values()), dtype=np.int64)
+        order = np.argsort(unique_words, kind='mergesort')
+        unique_words, counts = unique_words[order], counts[order]
+    else:
+        unique_words, counts = np.unique(np.asarray(words), return_counts=True)
+        counts = counts.astype(np.int64)
+    # the most common words first, np.unique already sorted the words
+    order = np.argsort(-counts, kind='mergesort')
+    unk_count = 0
+    if unk_word is not None:
+        if unique_words.dtype.kind == 'S' and not isinstance(unk_word, bytes):
+            unk_word = unk_word.encode('utf-8')
+        is_unk = unique_words[order] == np.asarray(unk_word)
+        unk_count += counts[order][is_unk].sum()
+        order = order[~is_unk]
+    keep = counts[order] >= min_count
+    if vocabulary_size is not None:
+        keep[max(0, vocabulary_size - (unk_word is not None)):] = False
+    unk_count += counts[order][~keep].sum()
+    order = order[keep]
+    kept_words = unique_words[order]
+    kept_counts = counts[order]
+    if unk_word is not None:
+        # np.concatenate widens the dtype if unk_word is longer than the kept words
+        kept_words = np.concatenate([np.asarray([unk_word]), kept_words])
+        kept_counts = np.concatenate([[unk_count], kept_counts]).astype(np.int64)
+    sorted_ids = np.argsort(kept_words, kind='mergesort').astype(np.int32)
+    return Vocabulary(kept_words[sorted_ids], sorted_ids, kept_counts,
+                        unk_id=None if unk_word is None else 0)
+
+def load_vocabulary(name='vocab.bin'):
+    """Load a :class:`Vocabulary` saved by Vocabulary.save(), the arrays are
+    memory-mapped so it opens in constant time.
+    """
+    arrays = _read_array_file(name)
+    unk_id = int(arrays['unk_id'][0])
+    return Vocabulary(arrays['sorted_words'], arrays['sorted_ids'], arrays['counts'],
+                        unk_id=None if unk_id < 0 else unk_id, positions=arrays['positions'])
+
 def save_vocab(count, name='vocab.txt'):
     """Save the vocabulary to a file so the model can be reloaded.
 
@@ -810,8 +1437,9 @@ def save_vocab(count, name='vocab.txt'):
 
 
 ## Load and save network
-def save_npz(save_dict={}, name='model.npz'):
+def save_npz(save_dict={}, name='model.npz', sess=None):
     """Input parameters and the file name, save parameters into .npz file. Use tl.utils.load_npz() to restore.
+    To save the parameters by name and load them memory-mapped, see save_named_params().
 
     Parameters
     ----------
@@ -819,6 +1447,9 @@ def save_npz(save_dict={}, name='model.npz'):
         Parameters want to be saved.
     name : a string or None
         The name of the .npz file.
+    sess : TensorFlow Session or None
+        If given, all the parameters are fetched in one run, instead of one eval() each.
+        To save without blocking the training, see CheckpointWriter.
 
     Examples
     --------
@@ -838,8 +1469,12 @@ def save_npz(save_dict={}, name='model.npz'):
     `Saving dictionary using numpy <http://stackoverflow.com/questions/22315595/saving-dictionary-of-header-information-using-numpy-savez>`_
     """
     rename_dict = {}
-    for k, value in enumerate(save_dict):
-        rename_dict.update({'param'+str(k) : value.eval()})
+    if sess is not None:
+        values = sess.run(list(save_dict))
+    else:
+        values = [value.eval() for value in save_dict]
+    for k, value in enumerate(values):
+        rename_dict.update({'param'+str(k) : value})
     np.savez(name, **rename_dict)
     print('Model is saved to: %s' % name)
 
@@ -869,13 +1504,20 @@ def load_npz(path='', name='model.npz'):
     d = np.load( path+name )
     params = []
     print('Load Model')
-    for key, val in sorted( d.items() ):
+    # param10 must come after param9, not after param1, other names (e.g. arr_0) sort the same way
+    for key, val in sorted( d.items(), key=lambda item: _natural_key(item[0]) ):
         params.append(val)
         print('Loading %s, %s' % (key, str(val.shape)))
     return params
 
+def _natural_key(name):
+    """Return a sort key of name which compares the runs of digits as numbers."""
+    return [(0, int(part), '') if part.isdigit() else (1, 0, part) for part in re.split(r'(\d+)', name)]
+
 def assign_params(sess, params, network):
-    """Assign the given parameters to the TensorLayer network.
+    """Assign the given parameters to the TensorLayer network in one run.
+    The assign ops are created at the first call and fed by placeholders,
+    so assigning again, e.g. to reload a model, does not grow the graph.
 
     Parameters
     ----------
@@ -901,9 +1543,679 @@ def assign_params(sess, params, network):
     ----------
     `Assign value to a TensorFlow variable <http://stackoverflow.com/questions/34220532/how-to-assign-value-to-a-tensorflow-variable>`_
     """
+    assign_ops, feed_dict = [], {}
     for idx, param in enumerate(params):
-        assign_op = network.all_params[idx].assign(param)
-        sess.run(assign_op)
+        placeholder, assign_op = _get_assign_op(network, network.all_params[idx])
+        assign_ops.append(assign_op)
+        feed_dict[placeholder] = param
+    sess.run(assign_ops, feed_dict=feed_dict)
+
+def _get_assign_op(network, variable):
+    """Return a placeholder and an op assigning it to variable, created once
+    per network and variable, so loading parameters again does not grow the graph.
+    The ops are kept by the network, so they are freed with it and its graph.
+    """
+    if network._assign_ops is None:
+        network._assign_ops = {}
+    if variable not in network._assign_ops:
+        with variable.graph.as_default():
+            placeholder = tf.placeholder(variable.dtype.base_dtype, shape=variable.get_shape())
+            network._assign_ops[variable] = (placeholder, variable.assign(placeholder))
+    return network._assign_ops[variable]
+
+def save_named_params(params=[], name='model.bin', sess=None):
+    """Save parameters into a binary file keyed by their TensorFlow variable
+    names, use tl.files.load_named_params() to restore. The file has a header
+    index and the arrays uncompressed and aligned, so it is memory-mapped when
+    loading, unlike .npz which must be read and decompressed entirely.
+
+    Parameters
+    ----------
+    params : a list of TensorFlow variables
+        Parameters want to be saved, e.g. network.all_params, a variable listed twice is saved once.
+    name : a string
+        The name of the file.
+    sess : TensorFlow Session or None
+        The values are fetched in one run of this session, the default session if None.
+
+    Examples
+    --------
+    >>> tl.files.save_named_params(network.all_params, name='model.bin', sess=sess)
+    ... Model is saved to: model.bin
+    >>> load_params = tl.files.load_named_params(name='model.bin')
+    ... Loading relu1/W:0, (784, 800)
+    ... Loading relu1/b:0, (800,)
+    ... ...
+    >>> tl.files.assign_named_params(sess, load_params, network)
+    ...
+    ... Only load the parameters of one layer
+    >>> load_params = tl.files.load_named_params(name='model.bin', prefix='relu1/')
+    """
+    unique_params, names = [], set()
+    for p in params:
+        if p.name not in names:
+            names.add(p.name)
+            unique_params.append(p)
+    if sess is None:
+        sess = tf.get_default_session()
+    values = sess.run(unique_params)
+    _write_array_file(name, [(p.name, value) for p, value in zip(unique_params, values)])
+    print('Model is saved to: %s' % name)
+
+def load_named_params(path='', name='model.bin', prefix=None, printable=True):
+    """Load the parameters saved by tl.files.save_named_params(). The file is
+    memory-mapped and only its header is read, the values of a parameter are
+    read from disk when they are used, so a large file opens in constant time.
+
+    Parameters
+    ----------
+    path : a string
+        Folder path to the file.
+    name : a string
+        The name of the file.
+    prefix : a string or None
+        Only return the parameters whose name starts with prefix, e.g. the name of a layer.
+    printable : boolen
+        Whether to print the name and shape of each parameter.
+
+    Returns
+    --------
+    params : an OrderedDict
+        The variable name to the read-only array of each parameter, in saving order.
+
+    Examples
+    --------
+    >>> see save_named_params
+    """
+    params = _read_array_file(os.path.join(path, name))
+    if prefix is not None:
+        params = collections.OrderedDict((key, val) for key, val in params.items()
+                                            if key.startswith(prefix))
+    if printable:
+        print('Load Model')
+        for key, val in params.items():
+            print('Loading %s, %s' % (key, str(val.shape)))
+    return params
+
+def assign_named_params(sess, params, network):
+    """Assign the parameters loaded by tl.files.load_named_params() to the
+    variables of the TensorLayer network with the same names, in one run.
+
+    Parameters
+    ----------
+    sess : TensorFlow Session
+    params : a dictionary
+        The variable name to the value of each parameter.
+    network : :class:`Layer` class
+        The network to be assigned
+
+    Returns
+    --------
+    missing : a list of string
+        The names of the variables of the network which are not in params.
+
+    Examples
+    --------
+    >>> see save_named_params
+    """
+    assign_ops, feed_dict, missing = [], {}, []
+    for p in network.all_params:
+        if p.name in params:
+            placeholder, assign_op = _get_assign_op(network, p)
+            assign_ops.append(assign_op)
+            feed_dict[placeholder] = params[p.name]
+        elif p.name not in missing:
+            missing.append(p.name)
+    for p_name in missing:
+        print("  [!] %s is not in params" % p_name)
+    sess.run(assign_ops, feed_dict=feed_dict)
+    return missing
+
+def save_sharded_params(params=[], path='model_shards', sess=None, max_shard_bytes=1 << 26,
+                        float16=False, compress=None, n_threads=4):
+    """Save parameters into a folder of shards, for large embedding matrices.
+    Each parameter is split row-wise into files of about max_shard_bytes,
+    which are written in parallel by a pool of threads, and a manifest.json
+    gives the name, shape and the rows of each shard, so that a reader can load
+    only the shards it needs, see load_sharded_params() and load_sharded_rows().
+    Saving again writes new shards and replaces the manifest before removing
+    the old shards, so a reader always finds the shards of the manifest it read.
+
+    Parameters
+    ----------
+    params : a list of TensorFlow variables
+        Parameters want to be saved, e.g. network.all_params, they are saved by variable name.
+    path : a string
+        The folder of the shards, created if it does not exist.
+    sess : TensorFlow Session or None
+        The values are fetched in one run of this session, the default session if None.
+    max_shard_bytes : int
+        The maximum size of a shard before compression, a shard has at least one row.
+    float16 : boolen
+        If True, store the floating point parameters as float16, they are loaded in their own dtype.
+    compress : None or 'zlib'
+        Compress each shard with zlib.
+    n_threads : int
+        The number of threads writing the shards.
+
+    Examples
+    --------
+    >>> tl.files.save_sharded_params(emb_net.all_params, path='w2v_shards', sess=sess, compress='zlib')
+    ... Model is saved to: w2v_shards
+    >>> load_params = tl.files.load_sharded_params(path='w2v_shards')
+    >>> tl.files.assign_named_params(sess, load_params, emb_net)
+    ...
+    ... Only load the vectors of the words 0 to 999
+    >>> vectors = tl.files.load_sharded_rows('w2v_shards', 'word2vec_layer/embeddings:0', 0, 1000)
+    """
+    if compress not in [None, 'zlib']:
+        raise Exception("Unknown compress %s, use None or 'zlib'" % compress)
+    unique_params, names = [], set()
+    for p in params:
+        if p.name not in names:
+            names.add(p.name)
+            unique_params.append(p)
+    if sess is None:
+        sess = tf.get_default_session()
+    values = sess.run(unique_params)
+    if not os.path.exists(path):
+        os.makedirs(path)
+    # the shards of the saved model are kept until the new manifest replaces
+    # its manifest, so the new shards are named by a generation it does not use
+    manifest_file = os.path.join(path, 'manifest.json')
+    old_files = []
+    if os.path.exists(manifest_file):
+        with open(manifest_file) as f:
+            old_files = [shard['file'] for info in json.load(f).values() for shard in info['shards']]
+    generation = 0
+    while any(old_file.startswith('gen%d.' % generation) for old_file in old_files):
+        generation += 1
+    manifest, jobs = collections.OrderedDict(), []
+    for idx, (p, value) in enumerate(zip(unique_params, values)):
+        value = np.asarray(value)
+        stored_dtype = np.float16 if float16 and value.dtype.kind == 'f' else value.dtype
+        if value.ndim == 0 or value.shape[0] == 0:
+            bounds = [0, value.shape[0] if value.ndim else 0]
+        else:
+            row_bytes = max(1, value.nbytes // value.shape[0])
+            rows = max(1, max_shard_bytes // row_bytes)
+            bounds = list(range(0, value.shape[0], rows)) + [value.shape[0]]
+        shards = []
+        for k in xrange(len(bounds) - 1):
+            shard_file = 'gen%d.param%d.shard%d' % (generation, idx, k)
+            shards.append({'file': shard_file, 'start': bounds[k], 'stop': bounds[k + 1]})
+            shard = value[bounds[k]:bounds[k + 1]] if value.ndim else value
+            jobs.append((os.path.join(path, shard_file), shard, stored_dtype))
+        manifest[p.name] = {'dtype': value.dtype.str, 'shape': list(value.shape),
+                            'stored_dtype': np.dtype(stored_dtype).str,
+                            'compress': compress, 'shards': shards}
+
+    def write_shard(job):
+        filename, shard, stored_dtype = job
+        data = np.ascontiguousarray(shard, dtype=stored_dtype).tobytes()
+        if compress == 'zlib':
+            data = zlib.compress(data, 1)
+        with open(filename, 'wb') as f:
+            f.write(data)
+
+    _thread_map(write_shard, jobs, n_threads)
+    _write_json(manifest, manifest_file)
+    # the old shards are removed once the new manifest does not refer to them
+    for old_file in old_files:
+        if os.path.exists(os.path.join(path, old_file)):
+            os.remove(os.path.join(path, old_file))
+    print('Model is saved to: %s' % path)
+
+def load_sharded_params(path='model_shards', prefix=None, n_threads=4, printable=True):
+    """Load the parameters saved by tl.files.save_sharded_params(), the shards
+    are read and decompressed in parallel by a pool of threads.
+
+    Parameters
+    ----------
+    path : a string
+        The folder of the shards.
+    prefix : a string or None
+        Only read the parameters whose name starts with prefix, e.g. the name of a layer.
+    n_threads : int
+        The number of threads reading the shards.
+    printable : boolen
+        Whether to print the name and shape of each parameter.
+
+    Returns
+    --------
+    params : an OrderedDict
+        The variable name to the value of each parameter, in saving order.
+
+    Examples
+    --------
+    >>> see save_sharded_params
+    """
+    with open(os.path.join(path, 'manifest.json')) as f:
+        manifest = json.load(f, object_pairs_hook=collections.OrderedDict)
+    params, jobs = collections.OrderedDict(), []
+    for key, info in manifest.items():
+        if prefix is not None and not key.startswith(prefix):
+            continue
+        params[key] = np.empty(info['shape'], dtype=info['dtype'])
+        for shard in info['shards']:
+            jobs.append((path, info, shard, params[key]))
+    _thread_map(_read_shard, jobs, n_threads)
+    if printable:
+        print('Load Model')
+        for key, val in params.items():
+            print('Loading %s, %s' % (key, str(val.shape)))
+    return params
+
+def load_sharded_rows(path, name, start, stop, n_threads=4):
+    """Read the rows start to stop of a parameter saved by
+    tl.files.save_sharded_params(), only the shards holding them are read.
+
+    Parameters
+    ----------
+    path : a string
+        The folder of the shards.
+    name : a string
+        The variable name of the parameter.
+    start, stop : int
+        The rows to read, like value[start:stop].
+    n_threads : int
+        The number of threads reading the shards.
+
+    Examples
+    --------
+    >>> see save_sharded_params
+    """
+    with open(os.path.join(path, 'manifest.json')) as f:
+        info = json.load(f)[name]
+    start, stop, _ = slice(start, stop).indices(info['shape'][0])
+    stop = max(start, stop)
+    out = np.empty([stop - start] + info['shape'][1:], dtype=info['dtype'])
+    jobs = [(path, info, shard, out, start, stop) for shard in info['shards']
+                if shard['start'] < stop and shard['stop'] > start]
+    _thread_map(_read_shard, jobs, n_threads)
+    return out
+
+def _read_shard(job):
+    """Read a shard of save_sharded_params() into out, or its rows start to
+    stop into out if they are given.
+    """
+    path, info, shard, out = job[:4]
+    with open(os.path.join(path, shard['file']), 'rb') as f:
+        data = f.read()
+    if info['compress'] == 'zlib':
+        data = zlib.decompress(data)
+    value = np.frombuffer(data, dtype=info['stored_dtype'])
+    if len(info['shape']) == 0:
+        out[...] = value.reshape(())
+        return
+    value = value.reshape([shard['stop'] - shard['start']] + info['shape'][1:])
+    if len(job) == 4:
+        out[shard['start']:shard['stop']] = value
+    else:
+        start, stop = job[4:]
+        lo, hi = max(start, shard['start']), min(stop, shard['stop'])
+        out[lo - start:hi - start] = value[lo - shard['start']:hi - shard['start']]
+
+def _thread_map(func, jobs, n_threads):
+    """Run func on each job with a pool of n_threads threads."""
+    from multiprocessing.pool import ThreadPool
+    if n_threads <= 1 or len(jobs) <= 1:
+        for job in jobs:
+            func(job)
+        return
+    pool = ThreadPool(min(n_threads, len(jobs)))
+    try:
+        pool.map(func, jobs)
+    finally:
+        pool.close()
+        pool.join()
+
+class CheckpointWriter(object):
+    """Save the parameters of a network without stalling the training loop.
+    save() fetches all the parameters in one run of the session, which is the
+    only time the training is blocked, then a background thread serializes
+    them, syncs the file to disk and atomically replaces the previous file.
+
+    Parameters
+    ----------
+    params : a list of TensorFlow variables
+        The parameters to save, e.g. network.all_params.
+    sess : TensorFlow Session or None
+        The session to fetch the parameters, the default session if None.
+    max_pending : int
+        The maximum number of saves which are not written yet, save() waits
+        when reached, which bounds the memory used by the snapshots.
+    named : boolen
+        If True, save by variable name in the format of save_named_params(),
+        otherwise as param0, param1, ... in the .npz format of save_npz().
+
+    Field (Class Variables)
+    -----------------------
+    blocked_time : float
+        The number of seconds the last save() blocked the training.
+    total_blocked_time : float
+        The number of seconds all the save() blocked the training.
+    n_saves : int
+        The number of calls of save().
+
+    Examples
+    --------
+    >>> writer = tl.files.CheckpointWriter(network.all_params, sess=sess)
+    >>> for epoch in range(n_epoch):
+    >>>     ...
+    >>>     writer.save('model.npz')
+    ... Model is saved to: model.npz (training blocked 0.012s)
+    >>> writer.close()
+    >>> load_params = tl.files.load_npz(name='model.npz')
+    """
+    def __init__(
+        self,
+        params = [],
+        sess = None,
+        max_pending = 1,
+        named = False,
+    ):
+        self.params = list(params)
+        self.sess = sess
+        self.named = named
+        self.blocked_time = 0.
+        self.total_blocked_time = 0.
+        self.n_saves = 0
+        self._pending = threading.Semaphore(max_pending)
+        self._queue = queue.Queue()
+        self._error = None
+        self._thread = threading.Thread(target=self._write_loop)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def save(self, name='model.npz'):
+        """Snapshot the parameters and write them to the file name in the
+        background, return the number of seconds the training was blocked.
+        """
+        self._raise_error()
+        start_time = time.time()
+        self._pending.acquire()
+        sess = self.sess if self.sess is not None else tf.get_default_session()
+        try:
+            values = sess.run(self.params)
+        except:
+            self._pending.release()
+            raise
+        self.blocked_time = time.time() - start_time
+        self.total_blocked_time += self.blocked_time
+        self.n_saves += 1
+        self._queue.put((name, values, self.blocked_time))
+        return self.blocked_time
+
+    def wait(self):
+        """Wait until all the saves are written."""
+        self._queue.join()
+        self._raise_error()
+
+    def close(self):
+        """Wait until all the saves are written and stop the background thread."""
+        self._queue.join()
+        self._queue.put(None)
+        self._thread.join()
+        self._raise_error()
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise Exception("Checkpoint writer failed: %s" % error)
+
+    def _write_loop(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                self._queue.task_done()
+                return
+            name, values, blocked_time = job
+            try:
+                if self.named:
+                    arrays, names = [], set()
+                    for p, value in zip(self.params, values):
+                        if p.name not in names:
+                            names.add(p.name)
+                            arrays.append((p.name, value))
+                    _write_array_file(name, arrays, fsync=True)
+                else:
+                    with _atomic_write(name) as f:
+                        np.savez(f, **dict(('param%d' % k, value) for k, value in enumerate(values)))
+                        f.flush()
+                        os.fsync(f.fileno())
+                print('Model is saved to: %s (training blocked %fs)' % (name, blocked_time))
+            except Exception as e:
+                self._error = e
+            finally:
+                self._pending.release()
+                self._queue.task_done()
+
+class DeltaCheckpointWriter(object):
+    """Save the parameters of an embedding network incrementally, e.g. of
+    :class:`Word2vecEmbeddingInputlayer` or :class:`EmbeddingInputlayer`, where
+    a training step only changes the rows of the words in the batch and of the
+    sampled words. The first save() writes a base file, the next ones only
+    write the rows which changed since the previous save, so the disk traffic
+    scales with the number of updated words instead of the vocabulary size.
+    After compact_every deltas, a new base is written and the deltas are removed.
+
+    The changed rows are tracked in the graph: mark_op sets the rows given by
+    row_ids (the input words and the NCE label and sampled words) in a boolean
+    variable of each parameter, and save() fetches only these rows and clears
+    the marks in one run, so neither a full copy of the parameters nor a host
+    copy to compare with is needed. The parameters without row IDs are written
+    whole in each delta.
+
+    This assumes the training only changes the rows of row_ids, which holds for
+    plain gradient descent (e.g. tf.train.GradientDescentOptimizer, Adagrad). It
+    does not hold if the training changes other rows: an optimizer whose sparse
+    update also moves the rows which are not in the gradient, e.g.
+    tf.train.AdamOptimizer (it decays the slots of every row, so every row moves),
+    check any optimizer with momentum, and a regularization of the embedding
+    matrix, e.g. L2, whose gradient is dense.
+    Then the deltas miss rows, so use host_diff=True, which fetches all the
+    parameters and compares them with a copy of the last saved values, as slow
+    as it is exact. If mark_op is not run, save() writes no rows and prints a
+    warning.
+
+    Parameters
+    ----------
+    params : a list of TensorFlow variables
+        The parameters to save by variable name, e.g. emb_net.all_params.
+    path : a string
+        The folder of the checkpoint, created if it does not exist.
+    sess : TensorFlow Session or None
+        The session to fetch the parameters, the default session if None.
+    compact_every : int
+        The number of deltas after which a new base is written.
+    row_ids : a dictionary or None
+        The tensor of the row IDs a training step changes of each parameter, e.g. emb_net.row_ids.
+    host_diff : boolen
+        If True, row_ids is not used, the changed rows of all the parameters are
+        found by comparing them with the last saved values, kept in memory.
+
+    Field (Class Variables)
+    -----------------------
+    mark_op : an op
+        Marks the rows of a training step, run it in the same run as the training op,
+        so the marked sampled words are the ones of this step.
+    n_rows : int
+        The number of rows written by the last save().
+
+    Examples
+    --------
+    >>> writer = tl.files.DeltaCheckpointWriter(emb_net.all_params, path='w2v_ckpt',
+    ...                 sess=sess, row_ids=emb_net.row_ids)
+    >>> sess.run(tf.initialize_all_variables())
+    >>> while step < num_steps:
+    >>>     sess.run([train_op, writer.mark_op], feed_dict=feed_dict)
+    >>>     if step % 40000 == 0:
+    >>>         writer.save()
+    ... Model is saved to: w2v_ckpt (1231 changed rows)
+    >>> load_params = tl.files.load_delta_checkpoint('w2v_ckpt')
+    >>> tl.files.assign_named_params(sess, load_params, emb_net)
+    """
+    def __init__(
+        self,
+        params = [],
+        path = 'model_ckpt',
+        sess = None,
+        compact_every = 10,
+        row_ids = None,
+        host_diff = False,
+    ):
+        self.params, names = [], set()
+        for p in params:
+            if p.name not in names:
+                names.add(p.name)
+                self.params.append(p)
+        self.path = path
+        self.sess = sess
+        self.compact_every = compact_every
+        self.n_rows = 0
+        self.host_diff = host_diff
+        self._manifest = None
+        self._saved = None
+        row_ids = {} if host_diff or row_ids is None else row_ids
+        # the boolean variable of the changed rows of each parameter with row IDs,
+        # on the CPU, where the boolean scatter is implemented
+        marks, mark_ops, self._tracked, self._fetches = [], [], set(), []
+        for p in self.params:
+            if p not in row_ids or p.get_shape().ndims == 0:
+                self._fetches.append(p)
+                continue
+            with tf.device('/cpu:0'):
+                with tf.name_scope(p.op.name + '_changed_rows'):
+                    changed = tf.Variable(tf.zeros([p.get_shape()[0].value], dtype=tf.bool),
+                                            trainable=False, name='changed')
+                    ids = tf.reshape(row_ids[p], [-1])
+                    mark_ops.append(tf.scatter_update(changed, ids, tf.ones_like(ids, dtype=tf.bool)))
+                    rows = tf.reshape(tf.where(changed), [-1])
+            marks.append(changed)
+            self._tracked.add(p.name)
+            self._fetches.append((rows, tf.gather(p, rows)))
+        # the number of runs of mark_op since the last save(), to warn if it is not run
+        with tf.device('/cpu:0'):
+            n_marks = tf.Variable(0, dtype=tf.int64, trainable=False, name='delta_checkpoint_n_marks')
+            self.mark_op = tf.group(tf.assign_add(n_marks, 1), *mark_ops)
+            self._n_marks = tf.identity(n_marks)
+        # the marks are cleared after the parameters, or their rows, are fetched
+        fetched = [x for f in self._fetches for x in (f if isinstance(f, tuple) else [f])]
+        with tf.control_dependencies(fetched + [self._n_marks]):
+            self._clear_op = tf.group(tf.assign(n_marks, 0), *[tf.assign(m, tf.zeros_like(m)) for m in marks])
+        sess = sess if sess is not None else tf.get_default_session()
+        if sess is not None:
+            sess.run(tf.initialize_variables(marks + [n_marks]))
+        if not os.path.exists(path):
+            os.makedirs(path)
+        # continue the numbering of an existing checkpoint, its files are
+        # removed when the first base replaces it
+        self._generation, self._old_files = 0, []
+        manifest_file = os.path.join(path, 'manifest.json')
+        if os.path.exists(manifest_file):
+            with open(manifest_file) as f:
+                manifest = json.load(f)
+            self._generation = manifest['generation'] + 1
+            self._old_files = [manifest['base']] + manifest['deltas']
+
+    def save(self):
+        """Write the rows changed since the previous save(), or a new base
+        if this is the first save() or compact_every deltas were written.
+        """
+        sess = self.sess if self.sess is not None else tf.get_default_session()
+        if self._manifest is None or len(self._manifest['deltas']) >= self.compact_every:
+            values, _ = sess.run([self.params, self._clear_op])
+            self._write_base(values)
+            return
+        fetched, n_marks, _ = sess.run([self._fetches, self._n_marks, self._clear_op])
+        if self._tracked and n_marks == 0:
+            print("  [!] mark_op was not run since the last save, the changed rows are unknown")
+        arrays = []
+        self.n_rows = 0
+        for p, value in zip(self.params, fetched):
+            if p.name in self._tracked:
+                rows, value = value
+                rows = rows.astype(np.int32)
+            elif self.host_diff:
+                value, saved = np.asarray(value), self._saved[p.name]
+                if value.ndim == 0:
+                    rows = np.arange(1 if value != saved else 0, dtype=np.int32)
+                    saved[...] = value
+                else:
+                    changed = value != saved
+                    if value.ndim > 1:
+                        changed = changed.reshape(len(changed), -1).any(axis=1)
+                    rows = np.flatnonzero(changed).astype(np.int32)
+                    value = value[rows]
+                    saved[rows] = value
+            else:
+                value = np.asarray(value)
+                rows = np.arange(len(value) if value.ndim else 1, dtype=np.int32)
+            if len(rows) > 0:
+                arrays.extend([(p.name + '|rows', rows), (p.name + '|values', value.reshape(1) if value.ndim == 0 else value)])
+                self.n_rows += len(rows)
+        delta_file = 'delta%d_%d.bin' % (self._generation, len(self._manifest['deltas']))
+        _write_array_file(os.path.join(self.path, delta_file), arrays, fsync=True)
+        self._manifest['deltas'].append(delta_file)
+        _write_json(self._manifest, os.path.join(self.path, 'manifest.json'))
+        print('Model is saved to: %s (%d changed rows)' % (self.path, self.n_rows))
+
+    def _write_base(self, values):
+        old_files, self._old_files = self._old_files, []
+        if self._manifest is not None:
+            old_files = [self._manifest['base']] + self._manifest['deltas']
+            self._generation += 1
+        arrays = [(p.name, np.asarray(value)) for p, value in zip(self.params, values)]
+        if self.host_diff:
+            self._saved = dict((key, np.array(value)) for key, value in arrays)
+        base_file = 'base%d.bin' % self._generation
+        _write_array_file(os.path.join(self.path, base_file), arrays, fsync=True)
+        self._manifest = {'generation': self._generation, 'base': base_file, 'deltas': []}
+        _write_json(self._manifest, os.path.join(self.path, 'manifest.json'))
+        # the old files are removed once the new manifest does not refer to them
+        for old_file in old_files:
+            os.remove(os.path.join(self.path, old_file))
+        self.n_rows = sum(len(value) if value.ndim else 1 for _, value in arrays)
+        print('Model is saved to: %s (base %s)' % (self.path, base_file))
+
+def load_delta_checkpoint(path='model_ckpt', printable=True):
+    """Load the parameters saved by :class:`DeltaCheckpointWriter`, the base
+    with the changed rows of each delta applied in order.
+
+    Parameters
+    ----------
+    path : a string
+        The folder of the checkpoint.
+    printable : boolen
+        Whether to print the name and shape of each parameter.
+
+    Returns
+    --------
+    params : an OrderedDict
+        The variable name to the value of each parameter.
+
+    Examples
+    --------
+    >>> see DeltaCheckpointWriter
+    """
+    with open(os.path.join(path, 'manifest.json')) as f:
+        manifest = json.load(f)
+    params = collections.OrderedDict((key, np.array(value)) for key, value in
+                    _read_array_file(os.path.join(path, manifest['base'])).items())
+    for delta_file in manifest['deltas']:
+        delta = _read_array_file(os.path.join(path, delta_file))
+        for key in params:
+            if key + '|rows' in delta:
+                if params[key].ndim == 0:
+                    params[key][...] = delta[key + '|values'][0]
+                else:
+                    params[key][delta[key + '|rows']] = delta[key + '|values']
+    if printable:
+        print('Load Model')
+        for key, val in params.items():
+            print('Loading %s, %s' % (key, str(val.shape)))
+    return params
 
 # Load and save variables
 def save_any_to_npy(save_dict={}, name='any.npy'):
@@ -978,3 +2290,148 @@ def load_file_list(path=None, regx='\.npz'):
     print('Match file list = %s' % return_list)
     print('Number of files = %d' % len(return_list))
     return return_list
+
+def _file_checksum(filename, block_size=1 << 20):
+    """Return the SHA-256 hex digest of a file."""
+    sha256 = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+def _load_cached_arrays(cache_dir, name, sources, array_names, decode):
+    """Return the arrays decoded from the ``sources`` files by ``decode()``,
+    memory-mapped from the .npy files of ``cache_dir`` if they were saved from
+    the same sources, otherwise decode and save them.
+
+    The index file ``name.json`` keeps the size, mtime and SHA-256 of each
+    source file, the checksum is only computed again when the size or mtime of
+    a source file changes.
+    """
+    index_file = os.path.join(cache_dir, name + '.json')
+    npy_files = [os.path.join(cache_dir, '%s_%s.npy' % (name, a)) for a in array_names]
+    stats = {}
+    for src in sources:
+        stats[src] = {'size': os.path.getsize(src), 'mtime': os.path.getmtime(src)}
+
+    if os.path.exists(index_file) and all(os.path.exists(f) for f in npy_files):
+        with open(index_file, 'r') as f:
+            index = json.load(f)
+        valid, touched = True, False
+        for src in sources:
+            entry = index.get(src)
+            if entry is None:
+                valid = False
+            elif entry['size'] != stats[src]['size'] or entry['mtime'] != stats[src]['mtime']:
+                # touched, but maybe not modified
+                valid = entry['size'] == stats[src]['size'] and entry['sha256'] == _file_checksum(src)
+                entry['mtime'] = stats[src]['mtime']
+                touched = True
+            if not valid:
+                break
+        if valid:
+            if touched:
+                _write_json(index, index_file)
+            return [np.load(f, mmap_mode='r') for f in npy_files]
+
+    print("Decoding %s into cache %s" % (name, cache_dir))
+    arrays = decode()
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+    for a, npy_file in zip(arrays, npy_files):
+        with _atomic_write(npy_file) as f:
+            np.save(f, a)
+    for src in sources:
+        stats[src]['sha256'] = _file_checksum(src)
+    _write_json(stats, index_file)
+    return arrays
+
+_ARRAY_FILE_MAGIC = b'TLARRAYS'
+
+def _write_array_file(filename, arrays, alignment=64, fsync=False):
+    """Write a list of (name, array) to a binary file: a magic string, the
+    length of a JSON header and the header, which gives the dtype, shape and
+    offset of each array, then the arrays uncompressed, each one aligned to
+    alignment bytes, so :func:`_read_array_file` can memory-map them.
+    The file is written to a temporary file first, synced to disk if fsync.
+    """
+    index, offset = collections.OrderedDict(), 0
+    arrays = [(key, np.asarray(value, order='C')) for key, value in arrays]
+    for key, value in arrays:
+        offset += -offset % alignment
+        index[key] = {'dtype': value.dtype.str, 'shape': list(value.shape), 'offset': offset}
+        offset += value.nbytes
+    header = json.dumps({'alignment': alignment, 'arrays': index}).encode('utf-8')
+    start = len(_ARRAY_FILE_MAGIC) + 8 + len(header)
+    start += -start % alignment
+    with _atomic_write(filename) as f:
+        f.write(_ARRAY_FILE_MAGIC)
+        f.write(np.array(len(header), dtype='<u8').tobytes())
+        f.write(header)
+        for key, value in arrays:
+            f.write(b'\0' * (start + index[key]['offset'] - f.tell()))
+            value.tofile(f)
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+
+def _read_array_file(filename):
+    """Memory-map the arrays of a file written by :func:`_write_array_file`,
+    return an OrderedDict of name to read-only array. Only the header is read,
+    the data of an array is read from disk when it is used.
+    """
+    with open(filename, 'rb') as f:
+        if f.read(len(_ARRAY_FILE_MAGIC)) != _ARRAY_FILE_MAGIC:
+            raise Exception("%s is not an array file" % filename)
+        header_length = int(np.frombuffer(f.read(8), dtype='<u8')[0])
+        header = json.loads(f.read(header_length).decode('utf-8'),
+                                object_pairs_hook=collections.OrderedDict)
+    start = len(_ARRAY_FILE_MAGIC) + 8 + header_length
+    start += -start % header['alignment']
+    data = np.memmap(filename, dtype=np.uint8, mode='r')
+    arrays = collections.OrderedDict()
+    for key, info in header['arrays'].items():
+        dtype, shape = np.dtype(info['dtype']), tuple(info['shape'])
+        offset = start + info['offset']
+        nbytes = dtype.itemsize * int(np.prod(shape))
+        arrays[key] = data[offset:offset + nbytes].view(dtype).reshape(shape)
+    return arrays
+
+def _write_json(obj, filename):
+    """Write obj to a JSON file through a temporary file."""
+    with _atomic_write(filename, 'w') as f:
+        json.dump(obj, f)
+
+## The umask of the process, read once as os.umask() can only be read by setting it
+_umask = os.umask(0)
+os.umask(_umask)
+
+@contextlib.contextmanager
+def _atomic_write(filename, mode='wb'):
+    """Open a temporary file next to filename for writing, which replaces
+    filename when the block ends, or is removed if the block raises.
+    The name of the temporary file is unique, so processes writing filename at
+    the same time, e.g. filling a cache on a cold start, never share it.
+    """
+    folder = os.path.dirname(filename)
+    fd, tmp_file = tempfile.mkstemp(dir=folder or '.', prefix=os.path.basename(filename) + '.', suffix='.tmp')
+    try:
+        # mkstemp creates the file readable by its owner only, give it the usual permissions
+        os.chmod(tmp_file, 0o666 & ~_umask)
+        with os.fdopen(fd, mode) as f:
+            yield f
+        _replace_file(tmp_file, filename)
+    except:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
+
+def _replace_file(src, dst):
+    """Rename src to dst, replacing dst atomically if it exists."""
+    if hasattr(os, 'replace'):
+        os.replace(src, dst)
+    else:
+        # Python 2, rename can not replace an existing file on Windows
+        if os.name == 'nt' and os.path.exists(dst):
+            os.remove(dst)
+        os.rename(src, dst)
@@ -4,9 +4,15 @@
 
 
 import numpy as np
+import threading
+import time
+from multiprocessing.pool import ThreadPool
 from six.moves import xrange
+from six.moves import queue
+import six
 
-def minibatches(inputs=None, targets=None, batch_size=None, shuffle=False):
+def minibatches(inputs=None, targets=None, batch_size=None, shuffle=False, n_buffers=None,
+                num_shards=1, shard_index=0, seed=None):
     """
     Generate a generator that input a group of example in 2D numpy.array and
     their labels, return the examples and labels by the given batchsize.
@@ -21,6 +27,24 @@ def minibatches(inputs=None, targets=None, batch_size=None, shuffle=False):
         The batch size.
     shuffle : boolean
         Indicating whether to use a shuffling queue, shuffle the dataset before return.
+    n_buffers : int or None
+        If None, every shuffled batch is a new array. Otherwise, the shuffled
+        batches are gathered into a ring of ``n_buffers`` preallocated buffers,
+        so no memory is allocated per batch. A returned batch stays valid until
+        ``n_buffers`` more batches have been returned, i.e. with ``n_buffers=1``
+        it is overwritten by the next batch, so copy it if you need to keep it.
+        Without shuffle, the batches are always views of inputs and targets.
+    num_shards : int
+        The number of workers (processes) of data-parallel training.
+    shard_index : int
+        The index of this worker, from 0 to num_shards - 1. The batches of the
+        epoch are dealt to the workers in turn, so every worker returns the same
+        number of batches and no example is returned by two workers.
+    seed : int or None
+        The random seed of the shuffle, use np.random if None. Give all workers
+        the same seed, and change it every epoch (e.g. seed=epoch), so they
+        agree on the global permutation without any communication. It is
+        required to shuffle with num_shards > 1.
 
     Examples
     --------
@@ -37,19 +61,432 @@ def minibatches(inputs=None, targets=None, batch_size=None, shuffle=False):
     ... (array([['e', 'e'],
     ...        ['f', 'f']],
     ...         dtype='<U1'), array([4, 5]))
+
+    >>> Allocation-free shuffled batches, each batch is valid until the next one
+    >>> for X_train_a, y_train_a in tl.iterate.minibatches(X_train, y_train,
+    ...                             batch_size=128, shuffle=True, n_buffers=1):
+    >>>     sess.run(train_op, feed_dict={x: X_train_a, y_: y_train_a})
+
+    >>> Data-parallel training, in the worker process with index task_index
+    >>> for epoch in range(n_epoch):
+    >>>     for X_train_a, y_train_a in tl.iterate.minibatches(X_train, y_train,
+    ...                 batch_size=128, shuffle=True, num_shards=n_workers,
+    ...                 shard_index=task_index, seed=epoch):
+    >>>         sess.run(train_op, feed_dict={x: X_train_a, y_: y_train_a})
     """
     assert len(inputs) == len(targets)
+    if shuffle and n_buffers:
+        inputs = np.asarray(inputs)
+        targets = np.asarray(targets)
+        buffers = [(np.empty((batch_size,) + inputs.shape[1:], dtype=inputs.dtype),
+                    np.empty((batch_size,) + targets.shape[1:], dtype=targets.dtype))
+                    for _ in range(n_buffers)]
+    for k, excerpt in enumerate(_minibatch_excerpts(len(inputs), batch_size, shuffle,
+                                                    num_shards, shard_index, seed)):
+        if shuffle and n_buffers:
+            inputs_buffer, targets_buffer = buffers[k % n_buffers]
+            # mode='clip' as mode='raise' always gathers into a temporary buffer
+            np.take(inputs, excerpt, axis=0, out=inputs_buffer, mode='clip')
+            np.take(targets, excerpt, axis=0, out=targets_buffer, mode='clip')
+            yield inputs_buffer, targets_buffer
+        else:
+            yield inputs[excerpt], targets[excerpt]
+
+def _minibatch_excerpts(n_examples, batch_size, shuffle=False, num_shards=1, shard_index=0, seed=None):
+    """Yield the index (shuffled) or slice (in order) of every full minibatch
+    of one epoch, shared by :func:`minibatches` and :class:`MinibatchPrefetcher`.
+
+    With num_shards > 1, the k-th batch of the epoch belongs to the worker
+    k % num_shards, and the epoch is cut to the same number of batches for
+    every worker.
+    """
+    assert 0 <= shard_index < num_shards
+    _check_shard_seed(shuffle, num_shards, seed)
     if shuffle:
-        indices = np.arange(len(inputs))
-        np.random.shuffle(indices)
-    for start_idx in range(0, len(inputs) - batch_size + 1, batch_size):
+        indices = np.arange(n_examples)
+        if seed is None:
+            np.random.shuffle(indices)
+        else:
+            np.random.RandomState(seed).shuffle(indices)
+    n_batches = (n_examples // batch_size) // num_shards * num_shards
+    for k in range(shard_index, n_batches, num_shards):
+        start_idx = k * batch_size
         if shuffle:
-            excerpt = indices[start_idx:start_idx + batch_size]
+            yield indices[start_idx:start_idx + batch_size]
         else:
-            excerpt = slice(start_idx, start_idx + batch_size)
+            yield slice(start_idx, start_idx + batch_size)
+
+def _check_shard_seed(shuffle, num_shards, seed):
+    """Raise if the shards would shuffle with their own permutations, which
+    overlap and miss some examples.
+    """
+    if shuffle and num_shards > 1 and seed is None:
+        raise Exception("Shuffling with num_shards > 1 needs a seed, the same in every worker")
+
+def class_balanced_minibatches(inputs=None, targets=None, batch_size=None, class_weights=None,
+                                n_batches=None, seed=None):
+    """
+    Generate a generator that return class-balanced minibatches, the examples
+    are drawn (with replacement) by index from ``inputs`` and ``targets``,
+    instead of building an oversampled copy of the dataset as
+    :func:`tensorlayer.utils.class_balancing_oversample` does.
+
+    Each example of a batch first draws a class according to ``class_weights``
+    (uniformly by default), then an example of that class uniformly, so the
+    distribution is the same as training on the oversampled dataset.
+
+    Parameters
+    ----------
+    inputs : numpy.array
+        (X) The input features, every row is a example.
+    targets : numpy.array
+        (y) The class labels of inputs.
+    batch_size : int
+        The batch size.
+    class_weights : a dictionary or None
+        The sampling weight of each label, e.g. {0: 1., 1: 2.}, they are
+        normalized to sum to one. If None, all classes have the same weight.
+    n_batches : int or None
+        The number of batches to return. If None, it is the size of the
+        oversampled dataset (n_classes * the number of examples of the largest
+        class) divided by batch_size.
+    seed : int or None
+        The random seed, use np.random if None.
+
+    Examples
+    --------
+    >>> for X_train_a, y_train_a in tl.iterate.class_balanced_minibatches(
+    ...                                 X_train, y_train, batch_size=128):
+    >>>     sess.run(train_op, feed_dict={x: X_train_a, y_: y_train_a})
+    ...
+    >>> Weighted classes
+    >>> for X_train_a, y_train_a in tl.iterate.class_balanced_minibatches(
+    ...             X_train, y_train, batch_size=128, class_weights={0: 1., 1: 3.}):
+    >>>     ...
+    """
+    assert len(inputs) == len(targets)
+    rng = np.random if seed is None else np.random.RandomState(seed)
+    labels = np.asarray(targets)
+    classes, counts = np.unique(labels, return_counts=True)
+    # the examples of the k-th class are order[offsets[k]:offsets[k] + counts[k]]
+    order = np.argsort(labels, kind='mergesort')
+    offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    if class_weights is None:
+        p = np.ones(len(classes)) / len(classes)
+    else:
+        p = np.array([class_weights.get(c, 0.) for c in classes.tolist()], dtype=np.float64)
+        p = p / p.sum()
+    if n_batches is None:
+        n_batches = len(classes) * counts.max() // batch_size
+    for _ in range(n_batches):
+        k = rng.choice(len(classes), size=batch_size, p=p)
+        excerpt = order[offsets[k] + (rng.rand(batch_size) * counts[k]).astype(np.int64)]
         yield inputs[excerpt], targets[excerpt]
 
-def seq_minibatches(inputs, targets, batch_size, seq_length, stride=1):
+class MinibatchPrefetcher(object):
+    """
+    The :class:`MinibatchPrefetcher` class returns the same batches as
+    :func:`minibatches`, but the batches are gathered by a pool of worker
+    threads and put into a bounded queue ahead of time, so the (fancy indexing)
+    copy of the next batch overlaps with the ``sess.run`` of the current one.
+
+    Iterating over the instance runs one epoch; iterate again for the next
+    epoch. The batches are returned in order, and the worker threads are
+    stopped when the epoch ends or when the consumer breaks out of the loop.
+
+    Parameters
+    ----------
+    inputs : numpy.array
+        (X) The input features, every row is a example.
+    targets : numpy.array
+        (y) The labels of inputs, every row is a example.
+    batch_size : int
+        The batch size.
+    shuffle : boolean
+        Indicating whether to use a shuffling queue, shuffle the dataset before return.
+    n_threads : int
+        The number of worker threads gathering the batches.
+    queue_size : int
+        The maximum number of batches prepared ahead of the consumer.
+    num_shards : int
+        The number of workers (processes) of data-parallel training, see :func:`minibatches`.
+    shard_index : int
+        The index of this worker, from 0 to num_shards - 1.
+    seed : int or None
+        The random seed of the shuffle, use np.random if None. The n-th epoch
+        (counting from 0) uses seed + n, so all workers agree on the global
+        permutation of every epoch. It is required to shuffle with num_shards > 1.
+
+    Field (Class Variables)
+    -----------------------
+    wait_time : float
+        The seconds the consumer spent waiting for batches in the last epoch.
+    n_batches : int
+        The number of batches returned in the last epoch.
+
+    Examples
+    --------
+    >>> prefetcher = tl.iterate.MinibatchPrefetcher(X_train, y_train,
+    ...                     batch_size=128, shuffle=True, n_threads=2, queue_size=4)
+    >>> for epoch in range(n_epoch):
+    >>>     for X_train_a, y_train_a in prefetcher:
+    >>>         feed_dict = {x: X_train_a, y_: y_train_a}
+    >>>         sess.run(train_op, feed_dict=feed_dict)
+    >>>     print("waited %fs for %d batches" % (prefetcher.wait_time, prefetcher.n_batches))
+    """
+    def __init__(
+        self,
+        inputs = None,
+        targets = None,
+        batch_size = None,
+        shuffle = False,
+        n_threads = 2,
+        queue_size = 4,
+        num_shards = 1,
+        shard_index = 0,
+        seed = None,
+    ):
+        assert len(inputs) == len(targets)
+        assert n_threads >= 1 and queue_size >= 1
+        _check_shard_seed(shuffle, num_shards, seed)
+        self.inputs = inputs
+        self.targets = targets
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.n_threads = n_threads
+        self.queue_size = queue_size
+        self.num_shards = num_shards
+        self.shard_index = shard_index
+        self.seed = seed
+        self.n_epochs = 0
+        self.wait_time = 0.
+        self.n_batches = 0
+
+    def _gather(self, excerpt):
+        return self.inputs[excerpt], self.targets[excerpt]
+
+    def __iter__(self):
+        self.wait_time = 0.
+        self.n_batches = 0
+        seed = None if self.seed is None else self.seed + self.n_epochs
+        self.n_epochs += 1
+        pending = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+        pool = ThreadPool(self.n_threads)
+
+        def put(item):
+            # give up when the consumer has gone, instead of blocking forever
+            while not stop.is_set():
+                try:
+                    pending.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def feed():
+            try:
+                for excerpt in _minibatch_excerpts(len(self.inputs), self.batch_size, self.shuffle,
+                                                   self.num_shards, self.shard_index, seed):
+                    if not put(pool.apply_async(self._gather, (excerpt,))):
+                        return
+            finally:
+                put(None)   # end of epoch
+
+        feeder = threading.Thread(target=feed)
+        feeder.daemon = True
+        feeder.start()
+        try:
+            while True:
+                start_time = time.time()
+                result = pending.get()
+                if result is None:
+                    break
+                batch = result.get()
+                self.wait_time += time.time() - start_time
+                self.n_batches += 1
+                yield batch
+        finally:
+            stop.set()
+            feeder.join()
+            pool.terminate()
+            pool.join()
+
+class BucketIterator(object):
+    """
+    The :class:`BucketIterator` class returns minibatches of variable length
+    sequences (e.g. the ragged arrays of :func:`tensorlayer.files.load_imbd_dataset`),
+    the sequences of similar length are grouped into the same batch, so each
+    batch only needs to be padded to its own maximum length rather than to the
+    maximum length of the dataset.
+
+    Iterating over the instance runs one epoch and returns tuples of
+    (inputs, targets, lengths, mask). ``inputs`` is [batch_size, max_len] padded
+    with ``pad_value``, ``lengths`` is [batch_size] and ``mask`` is the
+    [batch_size, max_len] float32 mask of the non-padded steps.
+
+    Parameters
+    ----------
+    inputs : a list or numpy.array of sequences
+        (X) The input sequences, every row is a example.
+    targets : numpy.array
+        (y) The labels of inputs, every row is a example.
+    batch_size : int
+        The batch size.
+    boundaries : a list of int or None
+        If None, the sequences are sorted by length (ties broken randomly) and
+        every batch is padded to its own maximum length. Otherwise, sequences of
+        length <= boundaries[k] (and > boundaries[k-1]) go to the same bucket and
+        are padded to boundaries[k]; longer sequences go to a last bucket padded
+        to the batch maximum length.
+    shuffle : boolean
+        Indicating whether to shuffle the examples in the buckets and the order of the batches.
+    keep_remainder : boolean
+        If True, the last batch of each bucket can be smaller than batch_size,
+        otherwise it is dropped as :func:`minibatches` does.
+    pad_value : int or float
+        The value for the padded steps.
+    dtype : numpy data type
+        The data type of the returned inputs.
+
+    Field (Class Variables)
+    -----------------------
+    padding_efficiency : float
+        The fraction of non-padded steps in the batches of the last epoch,
+        use it to tune ``boundaries``.
+    n_batches : int
+        The number of batches returned in the last epoch.
+
+    Examples
+    --------
+    >>> X_train, y_train, X_test, y_test = tl.files.load_imbd_dataset(nb_words=20000)
+    >>> buckets = tl.iterate.BucketIterator(X_train, y_train, batch_size=32,
+    ...                     boundaries=[50, 100, 200, 400], shuffle=True)
+    >>> for X_a, y_a, len_a, mask_a in buckets:
+    >>>     feed_dict = {x: X_a, y_: y_a, seq_len: len_a}
+    >>>     sess.run(train_op, feed_dict=feed_dict)
+    >>> print("padding efficiency: %f" % buckets.padding_efficiency)
+    """
+    def __init__(
+        self,
+        inputs = None,
+        targets = None,
+        batch_size = None,
+        boundaries = None,
+        shuffle = True,
+        keep_remainder = False,
+        pad_value = 0,
+        dtype = np.int32,
+    ):
+        assert len(inputs) == len(targets)
+        self.inputs = inputs
+        self.targets = np.asarray(targets)
+        self.batch_size = batch_size
+        self.boundaries = boundaries
+        self.shuffle = shuffle
+        self.keep_remainder = keep_remainder
+        self.pad_value = pad_value
+        self.dtype = dtype
+        self.lengths = np.array([len(x) for x in inputs], dtype=np.int32)
+        if boundaries is not None:
+            self.bucket_ids = np.searchsorted(np.asarray(boundaries), self.lengths, side='left')
+        self.padding_efficiency = 0.
+        self.n_batches = 0
+
+    def _batch_indices(self):
+        """Return the list of example indices of every batch of one epoch."""
+        if self.boundaries is None:
+            # sort by length, ties broken randomly
+            noise = np.random.rand(len(self.lengths)) if self.shuffle else np.arange(len(self.lengths))
+            buckets = [np.lexsort((noise, self.lengths))]
+        else:
+            buckets = []
+            for k in range(len(self.boundaries) + 1):
+                indices = np.where(self.bucket_ids == k)[0]
+                if self.shuffle:
+                    np.random.shuffle(indices)
+                buckets.append(indices)
+        batches = []
+        for indices in buckets:
+            if self.keep_remainder:
+                stop = len(indices)
+            else:
+                stop = len(indices) - self.batch_size + 1
+            for start_idx in range(0, stop, self.batch_size):
+                batches.append(indices[start_idx:start_idx + self.batch_size])
+        if self.shuffle:
+            batches = [batches[i] for i in np.random.permutation(len(batches))]
+        return batches
+
+    def __iter__(self):
+        self.n_batches = 0
+        n_steps, n_padded = 0, 0
+        for excerpt in self._batch_indices():
+            lengths = self.lengths[excerpt]
+            max_len = int(lengths.max())
+            if self.boundaries is not None:
+                k = self.bucket_ids[excerpt[0]]
+                if k < len(self.boundaries):
+                    max_len = self.boundaries[k]
+            X = np.full((len(excerpt), max_len), self.pad_value, dtype=self.dtype)
+            for i, idx in enumerate(excerpt):
+                X[i, :lengths[i]] = self.inputs[idx]
+            mask = np.asarray(np.arange(max_len) < lengths[:, None], dtype=np.float32)
+            n_steps += lengths.sum()
+            n_padded += X.size
+            self.n_batches += 1
+            self.padding_efficiency = float(n_steps) / max(n_padded, 1)
+            yield X, self.targets[excerpt], lengths, mask
+
+def ragged_padded_batch(tokens, offsets, excerpt, maxlen=None, pad_value=0, dtype=np.int32):
+    """Return the padded [len(excerpt), max_len] batch of the sequences
+    ``excerpt`` of a ragged array, e.g. from ``tl.files.load_imbd_dataset(ragged=True)``,
+    the i-th sequence is ``tokens[offsets[i]:offsets[i+1]]``. The batch is
+    gathered with one vectorized indexing, without Python loop.
+
+    Parameters
+    ----------
+    tokens : numpy.array
+        The flat array of all sequences.
+    offsets : numpy.array
+        The start of each sequence in tokens, and the end of the last one.
+    excerpt : a list or numpy.array of int
+        The indices of the sequences in the batch.
+    maxlen : int or None
+        The sequences longer than maxlen are truncated (the first maxlen steps
+        are kept). If None, pad to the longest sequence of the batch.
+    pad_value : int or float
+        The value of the padded steps.
+    dtype : numpy data type
+        The data type of the batch.
+
+    Returns
+    --------
+    batch : numpy.array
+        The padded batch.
+    lengths : numpy.array
+        The lengths of the sequences in the batch, after truncation.
+
+    Examples
+    --------
+    >>> (tokens, offsets), y_train, X_test, y_test = tl.files.load_imbd_dataset(ragged=True)
+    >>> n_examples = len(offsets) - 1
+    >>> for excerpt in np.split(np.random.permutation(n_examples)[:n_examples // 32 * 32], n_examples // 32):
+    >>>     X_a, len_a = tl.iterate.ragged_padded_batch(tokens, offsets, excerpt, maxlen=400)
+    >>>     y_a = y_train[excerpt]
+    """
+    excerpt = np.asarray(excerpt, dtype=np.int64)
+    starts = offsets[excerpt]
+    lengths = offsets[excerpt + 1] - starts
+    if maxlen is not None:
+        lengths = np.minimum(lengths, maxlen)
+    max_len = int(lengths.max()) if maxlen is None else maxlen
+    batch = np.full((len(excerpt), max_len), pad_value, dtype=dtype)
+    mask = np.arange(max_len) < lengths[:, None]
+    batch[mask] = tokens[(starts[:, None] + np.arange(max_len))[mask]]
+    return batch, lengths
+
+def seq_minibatches(inputs, targets, batch_size, seq_length, stride=1, flatten=True, out=None, as_views=False):
     """
     Generate a generator that return a batch of sequence inputs and targets.
     It is for the "Synced sequence input and output" as
@@ -58,6 +495,35 @@ def seq_minibatches(inputs, targets, batch_size, seq_length, stride=1):
 
     If batch_size = 100, seq_length = 5, a return input will have 500 rows (examples).
 
+    Each batch is a new writable array, copied once from read-only strided
+    views over ``inputs`` and ``targets``. With ``as_views=True`` the views are
+    returned instead when possible, so no data is copied: with ``flatten=False``
+    always, and with ``flatten=True`` when the sequences do not overlap. They
+    are read-only, copy them before modifying them in place.
+
+    Parameters
+    ----------
+    inputs : numpy.array
+        (X) The input features, every row is a example.
+    targets : numpy.array
+        (y) The labels of inputs, every row is a example.
+    batch_size : int
+        The number of sequences in a batch.
+    seq_length : int
+        The length of each sequence.
+    stride : int
+        The step between the start of two consecutive sequences.
+    flatten : boolean
+        If True, return [batch_size * seq_length, ...] arrays, otherwise return
+        [batch_size, seq_length, ...] arrays.
+    out : a tuple of two numpy.array or None
+        If given, (inputs_buffer, targets_buffer) are C-contiguous arrays with
+        the shape of the returned arrays, the batches are written into these
+        buffers and the buffers are returned, so no memory is allocated per
+        batch. The buffers are overwritten by the next batch.
+    as_views : boolean
+        If True, return read-only views of inputs and targets when possible instead of copies.
+
     Examples
     --------
     >>> Synced sequence input and output.
@@ -98,22 +564,44 @@ def seq_minibatches(inputs, targets, batch_size, seq_length, stride=1):
     ... ['e' 'e']] [3 4]
     """
     assert len(inputs) == len(targets)
+    inputs = np.asarray(inputs)
+    targets = np.asarray(targets)
+    if out is not None:
+        for buf, data in zip(out, (inputs, targets)):
+            if flatten:
+                shape = (batch_size * seq_length,) + data.shape[1:]
+            else:
+                shape = (batch_size, seq_length) + data.shape[1:]
+            if buf.shape != shape or not buf.flags['C_CONTIGUOUS']:
+                raise Exception("The buffers in 'out' must be C-contiguous arrays of shape %s" % str(shape))
     n_loads = (batch_size * stride) + (seq_length - stride)
     for start_idx in range(0, len(inputs) - n_loads + 1, (batch_size * stride)):
-        seq_inputs = np.zeros((batch_size, seq_length) + inputs.shape[1:],
-                              dtype=inputs.dtype)
-        seq_targets = np.zeros((batch_size, seq_length) + targets.shape[1:],
-                               dtype=targets.dtype)
-        for b_idx in xrange(batch_size):
-            start_seq_idx = start_idx + (b_idx * stride)
-            end_seq_idx = start_seq_idx + seq_length
-            seq_inputs[b_idx] = inputs[start_seq_idx:end_seq_idx]
-            seq_targets[b_idx] = targets[start_seq_idx:end_seq_idx]
-        flatten_inputs = seq_inputs.reshape((-1,) + inputs.shape[1:])
-        flatten_targets = seq_targets.reshape((-1,) + targets.shape[1:])
-        yield flatten_inputs, flatten_targets
-
-def ptb_iterator(raw_data, batch_size, num_steps):
+        seq_inputs = _seq_windows(inputs, start_idx, batch_size, seq_length, stride)
+        seq_targets = _seq_windows(targets, start_idx, batch_size, seq_length, stride)
+        if out is not None:
+            np.copyto(out[0].reshape(seq_inputs.shape), seq_inputs)
+            np.copyto(out[1].reshape(seq_targets.shape), seq_targets)
+            yield out[0], out[1]
+        else:
+            if not as_views:
+                seq_inputs, seq_targets = np.array(seq_inputs), np.array(seq_targets)
+            if flatten:
+                seq_inputs = seq_inputs.reshape((-1,) + inputs.shape[1:])
+                seq_targets = seq_targets.reshape((-1,) + targets.shape[1:])
+            yield seq_inputs, seq_targets
+
+def _seq_windows(data, start_idx, batch_size, seq_length, stride):
+    """Return the [batch_size, seq_length, ...] read-only view of the sequences
+    of ``data`` starting at ``start_idx``, ``start_idx + stride``, ... without copy.
+    """
+    data = data[start_idx:]
+    windows = np.lib.stride_tricks.as_strided(data,
+                shape=(batch_size, seq_length) + data.shape[1:],
+                strides=(stride * data.strides[0],) + data.strides)
+    windows.flags.writeable = False
+    return windows
+
+def ptb_iterator(raw_data, batch_size, num_steps, num_shards=1, shard_index=0):
     """Iterates on a list of words. Yields (Returns) the source contexts and
     the target context by the given batch_size and num_steps (sequence_length).\n
     see ``PTB tutorial``.
@@ -126,14 +614,25 @@ def ptb_iterator(raw_data, batch_size, num_steps):
 
     Parameters
     ----------
-    raw_data : a list
+    raw_data : a list, numpy.array, numpy.memmap or a string
             the context in list format; note that context usually be
             represented by splitting by space, and then convert to unique
-            word IDs.
+            word IDs. For corpora larger than memory, give a ``np.memmap`` or
+            the file name of raw int32 word IDs (e.g. written by
+            ``ndarray.tofile``), the file is memory-mapped and only the current
+            batch is read into memory.
     batch_size : int
             the batch size.
     num_steps : int
             the number of unrolls. i.e. sequence_length
+    num_shards : int
+            the number of workers (processes) of data-parallel training.
+    shard_index : int
+            the index of this worker, from 0 to num_shards - 1. The data is
+            split into num_shards * batch_size rows as with a batch size of
+            num_shards * batch_size, and this worker iterates on the rows
+            [shard_index * batch_size, (shard_index + 1) * batch_size), so all
+            workers have the same epoch size.
 
     Yields
     ------
@@ -166,17 +665,26 @@ def ptb_iterator(raw_data, batch_size, num_steps):
     ... [[ 7  8  9]
     ...  [17 18 19]]
 
+    >>> Memory-mapped corpus
+    >>> np.asarray(train_data, dtype=np.int32).tofile('ptb.train.bin')
+    >>> for x, y in ptb_iterator('ptb.train.bin', batch_size=20, num_steps=35):
+    >>>     ...
+
     Code Reference
     --------------
     tensorflow/models/rnn/ptb/reader.py
     """
-    raw_data = np.array(raw_data, dtype=np.int32)
+    if isinstance(raw_data, six.string_types):
+        raw_data = np.memmap(raw_data, dtype=np.int32, mode='r')
+    elif not isinstance(raw_data, np.ndarray):
+        raw_data = np.array(raw_data, dtype=np.int32)
 
+    assert 0 <= shard_index < num_shards
     data_len = len(raw_data)
-    batch_len = data_len // batch_size
-    data = np.zeros([batch_size, batch_len], dtype=np.int32)
-    for i in range(batch_size):
-        data[i] = raw_data[batch_len * i:batch_len * (i + 1)]
+    batch_len = data_len // (batch_size * num_shards)
+    # a view, the i-th row is raw_data[batch_len * i:batch_len * (i + 1)]
+    data = raw_data[:batch_size * num_shards * batch_len].reshape(batch_size * num_shards, batch_len)
+    data = data[shard_index * batch_size:(shard_index + 1) * batch_size]
 
     epoch_size = (batch_len - 1) // num_steps
 
@@ -184,8 +692,8 @@ def ptb_iterator(raw_data, batch_size, num_steps):
         raise ValueError("epoch_size == 0, decrease batch_size or num_steps")
 
     for i in range(epoch_size):
-        x = data[:, i*num_steps:(i+1)*num_steps]
-        y = data[:, i*num_steps+1:(i+1)*num_steps+1]
+        x = np.array(data[:, i*num_steps:(i+1)*num_steps], dtype=np.int32)
+        y = np.array(data[:, i*num_steps+1:(i+1)*num_steps+1], dtype=np.int32)
         yield (x, y)
 
 
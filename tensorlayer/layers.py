@@ -21,7 +21,8 @@ import numpy as np
 ## Dynamically creat variable for keep prob
 # set_keep = locals()
 set_keep = globals()
-set_keep['_layers_name_list'] =[]
+# a set, so checking the name of a new layer does not grow with the network
+set_keep['_layers_name_list'] = set()
 set_keep['name_reuse'] = False
 
 ## Variable Operation
@@ -67,7 +68,7 @@ def clear_layers_name():
     >>> network2 = tl.layers.DenseLayer(network2, n_units=800, name='relu1')
     ...
     """
-    set_keep['_layers_name_list'] =[]
+    set_keep['_layers_name_list'] = set()
 
 def set_name_reuse(enable=True):
     """Enable or disable reuse layer name. By default, each layer must has unique
@@ -81,30 +82,24 @@ def set_name_reuse(enable=True):
     """
     set_keep['name_reuse'] = enable
 
-def initialize_rnn_state(state):
-    """Return the initialized RNN state.
-    The input is LSTMStateTuple or State of RNNCells.
+def initialize_rnn_state(state, sess=None):
+    """Return the initialized RNN state, evaluated in sess, the default session if None.
+    The input is LSTMStateTuple or State of RNNCells, the output is a LSTMStateTuple
+    of arrays or an array, to be fed as the initial state.
+    For a :class:`RNNLayer` with stateful=True, run its reset_state instead,
+    its state never leaves the session.
     """
+    if sess is None:
+        sess = tf.get_default_session()
     if isinstance(state, tf.nn.rnn_cell.LSTMStateTuple):
-        # when state_is_tuple=True for LSTM
-        # c = state.c.eval()
-        # h = state.h.eval()
-        # return (c, h)
-        # print(state)
-        # print(state[0])
-        new_state = state
-        new_state[0].assign(state[0].eval())
-        new_state[1].assign(state[1].eval())
-        # state[0] = state[0].eval()
-        # state[1] = state[1].eval()
-        # state.c = state.c.eval()
-        # state.h = state.h.eval()
-        return new_state
+        # when state_is_tuple=True for LSTM, the c and h are Tensors,
+        # e.g. of a FusedLSTMLayer, evaluate both in one run
+        c, h = sess.run([state.c, state.h])
+        return tf.nn.rnn_cell.LSTMStateTuple(c, h)
     else:
         # when state_is_tuple=False for LSTM
         # or other RNNs
-        new_state = state.eval()
-        return new_state
+        return sess.run(state)
 
 def print_all_variables():
     """Print all trainable and non-trainable variables
@@ -127,7 +122,39 @@ class Layer(object):
         The `Layer` class feeding into this layer.
     name : a string or None
         An optional name to attach to this layer.
+
+    Field (Class Variables)
+    -----------------------
+    all_layers : a list of tensors
+        The outputs of the layers of the network, in the order they were added.
+    all_params : a list of TensorFlow variables
+        The parameters of the network, in the order they were added.
+    all_drop : a dictionary
+        The keeping probability placeholder of each noise layer to its value.
+
+    Notes
+    -----
+    A new layer calls _connect() with the layer(s) feeding into it and what it
+    adds to the network, so building a network of N layers takes O(N) time.
+    all_layers, all_params and all_drop are computed from the graph of layers
+    the first time they are used, a layer, tensor or parameter shared by several
+    branches is listed once. Each of them can also be set directly, then it is
+    used as it is for this layer and the layers built on it.
     """
+    # what this layer adds to the network, and the layers feeding into it
+    _parents = ()
+    _new_layers = ()
+    _new_params = ()
+    _new_drop = {}
+    # all_layers, all_params and all_drop once computed or set
+    _all_layers = None
+    _all_params = None
+    _all_drop = None
+    # the assign ops of tl.files.assign_params(), see tl.files._get_assign_op()
+    _assign_ops = None
+    # the mean, median and std ops of each parameter, see print_params()
+    _param_stats_ops = None
+
     def __init__(
         self,
         inputs = None,
@@ -140,16 +167,108 @@ class Layer(object):
             \nHint : Use different name for different 'Layer'" % name)
         else:
             self.name = name
-            set_keep['_layers_name_list'].append(name)
+            set_keep['_layers_name_list'].add(name)
+
+    def _connect(self, parents, layers=[], params=[], drop={}):
+        """Record the layers feeding into this layer, and the output tensors,
+        parameters and keeping probabilities this layer adds to the network.
+        """
+        self._parents = list(parents)
+        self._new_layers = list(layers)
+        self._new_params = list(params)
+        self._new_drop = dict(drop)
+
+    def _collect(self, kind):
+        """Return all_layers, all_params or all_drop (kind is 'layers', 'params'
+        or 'drop') of the network ending at this layer, by a depth-first walk
+        visiting each layer once, the layers feeding into a layer come before it,
+        in the order they were given. The walk stops at a layer whose attribute
+        of this kind is computed or set already, for each kind on its own, so a
+        layer which only sets all_params keeps it in the networks built on it.
+        """
+        collected = {} if kind == 'drop' else []
+        seen_layers, seen_items = set(), set()
+
+        def add(items):
+            if kind == 'drop':
+                collected.update(items)
+                return
+            for item in items:
+                if id(item) not in seen_items:
+                    seen_items.add(id(item))
+                    collected.append(item)
+
+        # an explicit stack instead of recursion, networks can be deeper than the recursion limit
+        stack = [(self, False)]
+        while stack:
+            layer, parents_done = stack.pop()
+            if id(layer) in seen_layers:
+                continue
+            done = getattr(layer, '_all_' + kind)
+            if layer is not self and done is not None:
+                # computed or set already, it includes the layers feeding into it
+                seen_layers.add(id(layer))
+                add(done)
+            elif parents_done:
+                seen_layers.add(id(layer))
+                add(getattr(layer, '_new_' + kind))
+            else:
+                stack.append((layer, True))
+                for parent in reversed(layer._parents):
+                    if id(parent) not in seen_layers:
+                        stack.append((parent, False))
+        return collected
+
+    @property
+    def all_layers(self):
+        if self._all_layers is None:
+            self._all_layers = self._collect('layers')
+        return self._all_layers
+
+    @all_layers.setter
+    def all_layers(self, value):
+        self._all_layers = value
+
+    @property
+    def all_params(self):
+        if self._all_params is None:
+            self._all_params = self._collect('params')
+        return self._all_params
+
+    @all_params.setter
+    def all_params(self, value):
+        self._all_params = value
+
+    @property
+    def all_drop(self):
+        if self._all_drop is None:
+            self._all_drop = self._collect('drop')
+        return self._all_drop
+
+    @all_drop.setter
+    def all_drop(self, value):
+        self._all_drop = value
 
     # @staticmethod
 
 
     # @instancemethod
-    def print_params(self):
-        ''' Print all info of parameters in the network after initialize_all_variables()'''
+    def print_params(self, sess=None):
+        ''' Print all info of parameters in the network after initialize_all_variables().
+        The mean, median and std are computed in the graph and fetched in one run of sess,
+        the default session if None, so only these numbers are copied out of the session.
+        The median of a parameter of more than 65536 values is estimated from a sample. '''
+        if sess is None:
+            sess = tf.get_default_session()
+        if self._param_stats_ops is None:
+            self._param_stats_ops = {}
+        for p in self.all_params:
+            if p not in self._param_stats_ops:
+                self._param_stats_ops[p] = _param_stats(p)
+        stats = sess.run([self._param_stats_ops[p] for p in self.all_params])
         for i, p in enumerate(self.all_params):
-            print("  param %d: %s (mean: %f, median: %f, std: %f)   %s" % (i, str(p.eval().shape), p.eval().mean(), np.median(p.eval()), p.eval().std(), p.name))
+            mean, median, std = stats[i]
+            print("  param %d: %s (mean: %f, median: %f, std: %f)   %s" % (i, str(tuple(p.get_shape().as_list())), mean, median, std, p.name))
         print("  num of params: %d" % self.count_params())
 
 
@@ -162,18 +281,43 @@ class Layer(object):
 
 
     def count_params(self):
-        ''' Return the number of parameters in the network '''
+        ''' Return the number of parameters in the network, from their static shapes, without a session '''
         n_params = 0
         for i, p in enumerate(self.all_params):
             n = 1
-            for s in p.eval().shape:
-            # for s in p.get_shape():
-                # s = int(s)
+            for s in p.get_shape().as_list():
                 if s:
                     n = n * s
             n_params = n_params + n
         return n_params
 
+def _param_stats(param, max_median_samples=1 << 16):
+    """Return the ops computing the mean, median and std of a parameter,
+    print_params() keeps them in the network, so printing again does not grow
+    the graph, and they are freed with the network and its graph.
+    The median is the middle of the top half, as numpy.median. For a parameter
+    of more than max_median_samples values, it is the median of an evenly
+    strided sample of at most max_median_samples values, so a large embedding
+    matrix is not sorted into a copy of half its size.
+    """
+    with param.graph.as_default():
+        x = tf.reshape(tf.to_float(param), [-1])
+        n = 1
+        for s in param.get_shape().as_list():
+            n = n * s
+        mean = tf.reduce_mean(x)
+        std = tf.sqrt(tf.reduce_mean(tf.square(x - mean)))
+        if n > max_median_samples:
+            stride = -(-n // max_median_samples)
+            x = x[::stride]
+            n = -(-n // stride)
+        top_half = tf.nn.top_k(x, k=n // 2 + 1).values
+        if n % 2 == 1:
+            median = top_half[n // 2]
+        else:
+            median = (top_half[n // 2] + top_half[n // 2 - 1]) / 2.
+    return [mean, median, std]
+
 # Input layer
 class InputLayer(Layer):
     """
@@ -208,9 +352,6 @@ class InputLayer(Layer):
 
         self.outputs = inputs
 
-        self.all_layers = []
-        self.all_params = []
-        self.all_drop = {}
 
 # Word Embedding Input layer
 class Word2vecEmbeddingInputlayer(Layer):
@@ -256,6 +397,11 @@ class Word2vecEmbeddingInputlayer(Layer):
         The outputs of embedding layer.
     normalized_embeddings : tensor
         Normalized embedding matrix
+    row_ids : a dictionary
+        The IDs of the rows of each parameter which a training step changes, i.e.
+        the input words for the embeddings, the label and sampled (negative) words
+        for the NCE weights and biases, see tl.files.DeltaCheckpointWriter. Other rows
+        change too with e.g. tf.train.AdamOptimizer or an L2 regularization.
 
     Examples
     --------
@@ -354,13 +500,23 @@ class Word2vecEmbeddingInputlayer(Layer):
                                     **nce_b_init_args)
 
         # Compute the average NCE loss for the batch.
-        # tf.nce_loss automatically draws a new sample of the negative labels
-        # each time we evaluate the loss.
+        # The negative labels are drawn as tf.nce_loss does by default, a new
+        # sample each time we evaluate the loss, they are kept to know which
+        # rows of the NCE weights a training step changes.
+        nce_loss_args = dict(nce_loss_args)
+        if 'sampled_values' not in nce_loss_args:
+            nce_loss_args['sampled_values'] = tf.nn.log_uniform_candidate_sampler(
+                           true_classes=tf.cast(train_labels, tf.int64),
+                           num_true=nce_loss_args.get('num_true', 1),
+                           num_sampled=num_sampled, unique=True,
+                           range_max=vocabulary_size)
         self.nce_cost = tf.reduce_mean(
             tf.nn.nce_loss(weights=nce_weights, biases=nce_biases,
                            inputs=embed, labels=train_labels,
                            num_sampled=num_sampled, num_classes=vocabulary_size,
                            **nce_loss_args))
+        nce_rows = tf.concat(0, [tf.reshape(tf.cast(train_labels, tf.int64), [-1]),
+                                 tf.cast(nce_loss_args['sampled_values'][0], tf.int64)])
         # num_sampled: An int. The number of classes to randomly sample per batch
         #              Number of negative examples to sample.
         # num_classes: An int. The number of possible classes.
@@ -369,11 +525,10 @@ class Word2vecEmbeddingInputlayer(Layer):
 
         self.outputs = embed
         self.normalized_embeddings = tf.nn.l2_normalize(embeddings, 1)
+        self.row_ids = {embeddings: self.inputs, nce_weights: nce_rows, nce_biases: nce_rows}
 
 
-        self.all_layers = [self.outputs]
-        self.all_params = [embeddings, nce_weights, nce_biases]
-        self.all_drop = {}
+        self._connect([], layers=[self.outputs], params=[embeddings, nce_weights, nce_biases])
 
         # self.all_layers = list(layer.all_layers)    # list() is pass by value (shallow), without list is pass by reference
         # self.all_params = list(layer.all_params)
@@ -414,6 +569,9 @@ class EmbeddingInputlayer(Layer):
     outputs : a tensor
         The outputs of embedding layer.
         the outputs 3D tensor : [batch_size, num_steps(num_words), embedding_size]
+    row_ids : a dictionary
+        The IDs of the rows of the embedding matrix which a step looks up,
+        see tl.files.DeltaCheckpointWriter.
 
     Examples
     --------
@@ -484,10 +642,9 @@ class EmbeddingInputlayer(Layer):
         embed = tf.nn.embedding_lookup(embeddings, self.inputs)
 
         self.outputs = embed
+        self.row_ids = {embeddings: self.inputs}
 
-        self.all_layers = [self.outputs]
-        self.all_params = [embeddings]
-        self.all_drop = {}
+        self._connect([], layers=[self.outputs], params=[embeddings])
 
 
 
@@ -558,11 +715,7 @@ class DenseLayer(Layer):
             b = tf.get_variable(name='b', shape=(n_units), initializer=b_init, **b_init_args )
         self.outputs = act(tf.matmul(self.inputs, W) + b)
 
-        self.all_layers = list(layer.all_layers)    # list() is pass by value (shallow), without list is pass by reference
-        self.all_params = list(layer.all_params)
-        self.all_drop = dict(layer.all_drop)        # dict() is pass by value (shallow), without dict is pass by reference
-        self.all_layers.extend( [self.outputs] )
-        self.all_params.extend( [W, b] )
+        self._connect([layer], layers=[self.outputs], params=[W, b])
         # shallow cope, when ReconLayer updates the weights of encoder, the weights in network can be changed at the same time.
         # e.g. the encoder points to same physical memory address
         # network = InputLayer(x, name='input_layer')
@@ -753,7 +906,7 @@ class ReconLayer(DenseLayer):
                 if save:
                     try:
                         visualize.W(self.train_params[0].eval(), second=10, saveable=True, shape=[28,28], name=save_name+str(epoch+1), fig_idx=2012)
-                        files.save_npz([self.all_params[0]] , name=save_name+str(epoch+1)+'.npz')
+                        files.save_npz([self.all_params[0]] , name=save_name+str(epoch+1)+'.npz', sess=sess)
                     except:
                         raise Exception("You should change visualize.W(), if you want to save the feature images for different dataset")
 
@@ -800,11 +953,7 @@ class DropoutLayer(Layer):
         set_keep[name] = tf.placeholder(tf.float32)
         self.outputs = tf.nn.dropout(self.inputs, set_keep[name])
 
-        self.all_layers = list(layer.all_layers)
-        self.all_params = list(layer.all_params)
-        self.all_drop = dict(layer.all_drop)
-        self.all_drop.update( {set_keep[name]: keep} )
-        self.all_layers.extend( [self.outputs] )
+        self._connect([layer], layers=[self.outputs], drop={set_keep[name]: keep})
         # print(set_keep[name])    # Tensor("Placeholder_2:0", dtype=float32)
         # print(denoising1)           # Tensor("Placeholder_2:0", dtype=float32)
         # print(self.all_drop[denoising1])    # 0.8
@@ -886,12 +1035,7 @@ class DropconnectDenseLayer(Layer):
         W_dropcon = tf.nn.dropout(W,  set_keep[name])
         self.outputs = act(tf.matmul(self.inputs, W_dropcon) + b)
 
-        self.all_layers = list(layer.all_layers)
-        self.all_params = list(layer.all_params)
-        self.all_drop = dict(layer.all_drop)
-        self.all_drop.update( {set_keep[name]: keep} )
-        self.all_layers.extend( [self.outputs] )
-        self.all_params.extend( [W, b] )
+        self._connect([layer], layers=[self.outputs], params=[W, b], drop={set_keep[name]: keep})
 
 
 # Convolutional layer
@@ -975,11 +1119,7 @@ class Conv2dLayer(Layer):
         # b = tf.Variable( biases_initializer(shape=[shape[-1]]), name='b_conv')
         self.outputs = act( tf.nn.conv2d(self.inputs, W, strides=strides, padding=padding) + b )
 
-        self.all_layers = list(layer.all_layers)
-        self.all_params = list(layer.all_params)
-        self.all_drop = dict(layer.all_drop)
-        self.all_layers.extend( [self.outputs] )
-        self.all_params.extend( [W, b] )
+        self._connect([layer], layers=[self.outputs], params=[W, b])
 
 class PoolLayer(Layer):
     """
@@ -1025,11 +1165,7 @@ class PoolLayer(Layer):
 
         self.outputs = pool(self.inputs, ksize=ksize, strides=strides, padding=padding)
 
-        self.all_layers = list(layer.all_layers)
-        self.all_params = list(layer.all_params)
-        self.all_drop = dict(layer.all_drop)
-        self.all_layers.extend( [self.outputs] )
-        # self.all_params.extend( [W] )
+        self._connect([layer], layers=[self.outputs])
 
 
 # Recurrent layer
@@ -1066,6 +1202,22 @@ class RNNLayer(Layer):
         When return_last = False\n
             if True, return 2D Tensor [n_example, n_hidden], for stacking DenseLayer after it.
             if False, return 3D Tensor [n_example/n_steps, n_steps, n_hidden], for stacking multiple RNN after it.
+    dynamic : boolen
+        If True, run the cell in a TensorFlow while loop (tf.nn.dynamic_rnn) instead
+        of unrolling n_steps copies of it, so the size of the graph does not depend on
+        n_steps, and the inputs can have a variable number of steps.
+    sequence_length : a int32 tensor or None
+        When dynamic = True, the length of each sequence [batch_size], the steps after
+        the end of a sequence are not computed, their outputs are zeros and final_state
+        is the state at the end of each sequence. The last output of return_last = True
+        is the output at the end of each sequence.
+    stateful : boolen
+        If True, keep the state in non-trainable variables, initial_state reads them and
+        computing outputs assigns final_state to them, so the next run continues from
+        there without fetching and feeding the state, e.g. to generate text one word
+        at a time. The batch size must be fixed. Use reset_state at the beginning of
+        each epoch or sequence. Each layer has its own state, also when it reuses the
+        weights of another layer, e.g. a test model with batch_size = 1.
     name : a string or None
         An optional name to attach to this layer.
 
@@ -1088,6 +1240,10 @@ class RNNLayer(Layer):
         your state at the begining of each epoch or iteration according to your
         training procedure.
 
+    reset_state, snapshot_state, restore_state : operations
+        When stateful = True, set the state to zeros, copy the state to a
+        snapshot, and set the state back to the snapshot.
+
     Examples
     --------
     >>> x = tf.placeholder(tf.float32, shape=[None, D])
@@ -1100,6 +1256,24 @@ class RNNLayer(Layer):
     # ... For multiple RNNs
     # >>> network =
     #
+    # ... For variable length sequences, padded to the longest one
+    >>> x = tf.placeholder(tf.float32, shape=[batch_size, None, D])
+    >>> seq_len = tf.placeholder(tf.int32, shape=[batch_size])
+    >>> network = tl.layers.InputLayer(x, name='input_layer')
+    >>> network = tl.layers.RNNLayer(network, cell_fn=tf.nn.rnn_cell.BasicLSTMCell,
+    ...                 n_hidden=200, n_steps=num_steps, return_last=True,
+    ...                 dynamic=True, sequence_length=seq_len, name='lstm_layer')
+    #
+    # ... For generating text one word at a time, only the word is fed
+    >>> network = tl.layers.RNNLayer(network, cell_fn=tf.nn.rnn_cell.BasicLSTMCell,
+    ...                 n_hidden=200, n_steps=1, return_seq_2d=True,
+    ...                 stateful=True, name='lstm_layer')
+    >>> lstm = network
+    >>> network = tl.layers.DenseLayer(network, n_units=vocab_size, name='output_layer')
+    >>> sess.run(lstm.reset_state)
+    >>> for i in range(n_words):
+    >>>     out = sess.run(network.outputs, feed_dict={input_data: [[word_id]]})
+    >>>     word_id = tl.nlp.sample(out[0])
 
 
     Notes
@@ -1126,6 +1300,9 @@ class RNNLayer(Layer):
         return_last = False,
         # is_reshape = True,
         return_seq_2d = False,
+        dynamic = False,
+        sequence_length = None,
+        stateful = False,
         name = 'rnn_layer',
     ):
         Layer.__init__(self, name=name)
@@ -1133,8 +1310,8 @@ class RNNLayer(Layer):
         # n_in = layer.n_units
         # self.n_units = n_hidden
 
-        print("  tensorlayer:Instantiate RNNLayer %s: n_hidden:%d, n_steps:%d, in_dim:%d %s, cell_fn:%s " % (self.name, n_hidden,
-            n_steps, self.inputs.get_shape().ndims, self.inputs.get_shape(), cell_fn))
+        print("  tensorlayer:Instantiate RNNLayer %s: n_hidden:%d, n_steps:%d, in_dim:%d %s, cell_fn:%s, dynamic:%s " % (self.name, n_hidden,
+            n_steps, self.inputs.get_shape().ndims, self.inputs.get_shape(), cell_fn, dynamic))
 
         # self.inputs.get_shape().with_rank(2)
         # self.inputs.get_shape().with_rank(3)
@@ -1167,17 +1344,34 @@ class RNNLayer(Layer):
         outputs = []
         self.cell = cell = cell_fn(num_units=n_hidden, **cell_init_args)
         self.initial_state = cell.zero_state(batch_size, dtype=tf.float32)
+        if stateful:
+            if not fixed_batch_size.value:
+                raise Exception("RNNLayer with stateful=True needs a fixed batch_size")
+            # the state variables are not parameters of the network, they are
+            # created for each layer, also when the layer reuses the variables of another
+            with tf.name_scope(name + '_state'):
+                self.state_variables = _state_variables(self.initial_state, 'state')
+                snapshot_variables = _state_variables(self.initial_state, 'snapshot')
+            self.initial_state = _pack_state(self.initial_state, self.state_variables)
         state = self.initial_state
         # with tf.variable_scope("model", reuse=None, initializer=initializer):
         with tf.variable_scope(name, initializer=initializer) as vs:
-            for time_step in range(n_steps):
-                if time_step > 0: tf.get_variable_scope().reuse_variables()
-                (cell_output, state) = cell(self.inputs[:, time_step, :], state)
-                outputs.append(cell_output)
+            if dynamic:
+                # 3D Tensor [batch_size, n_steps, n_hidden], the graph has one copy of the cell
+                outputs, state = tf.nn.dynamic_rnn(cell, self.inputs, sequence_length=sequence_length,
+                                    initial_state=self.initial_state, scope=vs)
+            else:
+                for time_step in range(n_steps):
+                    if time_step > 0: tf.get_variable_scope().reuse_variables()
+                    (cell_output, state) = cell(self.inputs[:, time_step, :], state)
+                    outputs.append(cell_output)
 
             # Retrieve just the RNN variables.
             # rnn_variables = [v for v in tf.all_variables() if v.name.startswith(vs.name)]
             rnn_variables = tf.get_collection(tf.GraphKeys.VARIABLES, scope=vs.name)
+            if stateful:
+                # the scope is a prefix, rnn_layer matches the state variables in rnn_layer_state
+                rnn_variables = [v for v in rnn_variables if v.name.startswith(vs.name + '/')]
 
         print("     n_params : %d" % (len(rnn_variables)))
 
@@ -1191,7 +1385,23 @@ class RNNLayer(Layer):
         # for p in tf.trainable_variables():
         #     print('all_var', p.get_shape(), p.name)
 
-        if return_last:
+        if dynamic:
+            if return_last:
+                # 2D Tensor [batch_size, n_hidden], the output at the end of each sequence
+                dynamic_steps = tf.shape(outputs)[1]
+                if sequence_length is None:
+                    last_step = tf.fill(tf.expand_dims(tf.shape(outputs)[0], 0), dynamic_steps - 1)
+                else:
+                    last_step = tf.to_int32(sequence_length) - 1
+                last_index = tf.range(tf.shape(outputs)[0]) * dynamic_steps + last_step
+                self.outputs = tf.gather(tf.reshape(outputs, [-1, n_hidden]), last_index)
+            elif return_seq_2d:
+                # 2D Tensor [n_example, n_hidden]
+                self.outputs = tf.reshape(outputs, [-1, n_hidden])
+            else:
+                # 3D Tensor [n_example/n_steps, n_steps, n_hidden]
+                self.outputs = outputs
+        elif return_last:
             # 2D Tensor [batch_size, n_hidden]
             self.outputs = outputs[-1]
         else:
@@ -1206,13 +1416,187 @@ class RNNLayer(Layer):
 
         self.final_state = state
 
-        self.all_layers = list(layer.all_layers)
-        self.all_params = list(layer.all_params)
-        self.all_drop = dict(layer.all_drop)
+        if stateful:
+            final_states = _flatten_state(state)
+            self.reset_state = tf.group(*[v.assign(tf.zeros_like(v)) for v in self.state_variables])
+            self.snapshot_state = tf.group(*[b.assign(v) for b, v in zip(snapshot_variables, self.state_variables)])
+            self.restore_state = tf.group(*[v.assign(b) for b, v in zip(snapshot_variables, self.state_variables)])
+            update_state = tf.group(*[v.assign(f) for v, f in zip(self.state_variables, final_states)])
+            with tf.control_dependencies([update_state]):
+                self.outputs = tf.identity(self.outputs)
+
         # print(type(self.outputs))
-        self.all_layers.extend( [self.outputs] )
-        self.all_params.extend( rnn_variables )
+        self._connect([layer], layers=[self.outputs], params=rnn_variables)
+
+
+class FusedLSTMLayer(Layer):
+    """
+    The :class:`FusedLSTMLayer` class is a LSTM layer with the contract of
+    :class:`RNNLayer` with tf.nn.rnn_cell.BasicLSTMCell, but faster on CPU.
+    When TensorFlow has the block LSTM kernel of tf.contrib.rnn, and it accepts
+    the arguments, each time step is a single op. Otherwise, the inputs of all the time steps are multiplied
+    by the input weights in one matmul, then each time step only multiplies
+    the hidden state, and computes the four gates from one matmul.
+
+    The parameters have the layout of BasicLSTMCell: W is
+    [n_in + n_hidden, 4 * n_hidden] and b is [4 * n_hidden], with the gates in
+    the order input, new input, forget and output, so the parameters saved
+    from a RNNLayer with BasicLSTMCell can be assigned to this layer.
+
+    Parameters
+    ----------
+    layer : a :class:`Layer` instance
+        The `Layer` class feeding into this layer, the outputs are [batch_size, n_steps, n_in].
+    n_hidden : a int
+        The number of hidden units in the layer.
+    forget_bias : float
+        The bias added to the forget gate, as BasicLSTMCell.
+    initializer : initializer
+        The initializer for initializing the weight matrix.
+    n_steps : a int
+        The sequence length.
+    return_last : boolen
+        If True, return the last output, see :class:`RNNLayer`.
+    return_seq_2d : boolen
+        When return_last = False, return 2D Tensor [n_example, n_hidden] if True,
+        3D Tensor [n_example/n_steps, n_steps, n_hidden] if False, see :class:`RNNLayer`.
+    name : a string or None
+        An optional name to attach to this layer.
+
+    Field (Class Variables)
+    -----------------------
+    outputs : a tensor
+        The output of this LSTM, as :class:`RNNLayer`.
+    initial_state : a LSTMStateTuple
+        The initial state (c, h), zeros by default, feed it with the final_state
+        of the previous iteration to continue.
+    final_state : a LSTMStateTuple
+        The final state (c, h).
+
+    Examples
+    --------
+    >>> network = tl.layers.EmbeddingInputlayer(inputs=input_data,
+    ...                 vocabulary_size=vocab_size, embedding_size=hidden_size, name='embedding_layer')
+    >>> network = tl.layers.FusedLSTMLayer(network, n_hidden=hidden_size,
+    ...                 n_steps=num_steps, return_seq_2d=False, name='lstm_layer1')
+    >>> lstm1 = network
+    >>> network = tl.layers.FusedLSTMLayer(network, n_hidden=hidden_size,
+    ...                 n_steps=num_steps, return_seq_2d=True, name='lstm_layer2')
+    >>> lstm2 = network
+    >>> network = tl.layers.DenseLayer(network, n_units=vocab_size, name='output_layer')
+    ...
+    >>> feed_dict = {input_data: x, targets: y,
+    ...             lstm1.initial_state: state1, lstm2.initial_state: state2}
+    >>> _cost, state1, state2, _ = sess.run([cost, lstm1.final_state, lstm2.final_state, train_op],
+    ...                                     feed_dict=feed_dict)
 
+    References
+    ----------
+    `tensorflow/contrib/rnn/python/ops/lstm_ops.py <https://github.com/tensorflow/tensorflow/blob/master/tensorflow/contrib/rnn/python/ops/lstm_ops.py>`_
+    """
+    def __init__(
+        self,
+        layer = None,
+        n_hidden = 100,
+        forget_bias = 1.0,
+        initializer = tf.random_uniform_initializer(-0.1, 0.1),
+        n_steps = 5,
+        return_last = False,
+        return_seq_2d = False,
+        name = 'fused_lstm_layer',
+    ):
+        Layer.__init__(self, name=name)
+        self.inputs = layer.outputs
+        n_in = int(self.inputs.get_shape()[-1])
+        try:
+            from tensorflow.contrib.rnn.python.ops import lstm_ops
+            block_lstm = lstm_ops._block_lstm
+        except (ImportError, AttributeError):
+            block_lstm = None
+
+        print("  tensorlayer:Instantiate FusedLSTMLayer %s: n_hidden:%d, n_steps:%d, in_dim:%d %s, block kernel:%s " % (self.name, n_hidden,
+            n_steps, self.inputs.get_shape().ndims, self.inputs.get_shape(), block_lstm is not None))
+
+        fixed_batch_size = self.inputs.get_shape().with_rank_at_least(1)[0]
+        if fixed_batch_size.value:
+            batch_size = fixed_batch_size.value
+            zeros = tf.zeros([batch_size, n_hidden], dtype=tf.float32)
+        else:
+            batch_size = tf.shape(self.inputs)[0]
+            zeros = tf.zeros(tf.pack([batch_size, n_hidden]), dtype=tf.float32)
+        self.batch_size = batch_size
+        self.initial_state = tf.nn.rnn_cell.LSTMStateTuple(zeros, tf.identity(zeros))
+        c, h = self.initial_state
+
+        with tf.variable_scope(name, initializer=initializer) as vs:
+            W = tf.get_variable(name='W', shape=(n_in + n_hidden, 4 * n_hidden))
+            b = tf.get_variable(name='b', shape=(4 * n_hidden), initializer=tf.constant_initializer(0.0))
+
+            outputs = None
+            if block_lstm is not None:
+                inputs = [tf.squeeze(x, [1]) for x in tf.split(1, n_steps, self.inputs)]
+                try:
+                    # a large cell_clip for no clipping, as BasicLSTMCell
+                    _, cs, _, _, _, _, outputs = block_lstm(
+                            seq_len_max=tf.constant(n_steps, dtype=tf.int64), x=inputs, w=W, b=b,
+                            cs_prev=c, h_prev=h, forget_bias=forget_bias, cell_clip=1e30, use_peephole=False)
+                    outputs = list(outputs)
+                    c, h = cs[-1], outputs[-1]
+                except (ImportError, AttributeError, TypeError) as e:
+                    # the kernel is private, its arguments change between TensorFlow versions,
+                    # any other error is raised
+                    print("  [!] block LSTM kernel failed (%s), use the matmul version" % e)
+                    outputs = None
+            if outputs is None:
+                W_x, W_h = W[:n_in], W[n_in:]
+                # the input part of the gates of all the time steps in one matmul
+                x_gates = tf.matmul(tf.reshape(self.inputs, [-1, n_in]), W_x) + b
+                x_gates = tf.reshape(x_gates, [-1, n_steps, 4 * n_hidden])
+                outputs = []
+                for time_step in range(n_steps):
+                    gates = x_gates[:, time_step, :] + tf.matmul(h, W_h)
+                    i, j, f, o = tf.split(1, 4, gates)
+                    c = c * tf.sigmoid(f + forget_bias) + tf.sigmoid(i) * tf.tanh(j)
+                    h = tf.tanh(c) * tf.sigmoid(o)
+                    outputs.append(h)
+
+        if return_last:
+            # 2D Tensor [batch_size, n_hidden]
+            self.outputs = outputs[-1]
+        else:
+            if return_seq_2d:
+                # 2D Tensor [n_example, n_hidden]
+                self.outputs = tf.reshape(tf.concat(1, outputs), [-1, n_hidden])
+            else:
+                # 3D Tensor [n_example/n_steps, n_steps, n_hidden]
+                self.outputs = tf.reshape(tf.concat(1, outputs), [-1, n_steps, n_hidden])
+
+        self.final_state = tf.nn.rnn_cell.LSTMStateTuple(c, h)
+
+        self._connect([layer], layers=[self.outputs], params=[W, b])
+
+def _flatten_state(state):
+    """Return the tensors of a state, which can be a tensor or nested tuples of tensors."""
+    if isinstance(state, tuple):
+        return [t for s in state for t in _flatten_state(s)]
+    return [state]
+
+def _pack_state(state, tensors):
+    """Return tensors in the structure of state, the inverse of _flatten_state()."""
+    tensors = list(tensors)
+    def pack(s):
+        if isinstance(s, tuple):
+            items = [pack(item) for item in s]
+            return type(s)(*items) if hasattr(s, '_fields') else tuple(items)
+        return tensors.pop(0)
+    return pack(state)
+
+def _state_variables(state, name):
+    """Return a new non-trainable variable of zeros for each tensor of a state,
+    by tf.Variable, so they are never shared by the reuse of a variable scope.
+    """
+    return [tf.Variable(tf.zeros(t.get_shape(), dtype=t.dtype), trainable=False, name='%s%d' % (name, i))
+                for i, t in enumerate(_flatten_state(state))]
 
 # Shape layer
 class FlattenLayer(Layer):
@@ -1259,10 +1643,7 @@ class FlattenLayer(Layer):
         self.outputs = flatten_reshape(self.inputs)
         self.n_units = int(self.outputs._shape[-1])
         print("  tensorlayer:Instantiate FlattenLayer %s, %d" % (self.name, self.n_units))
-        self.all_layers = list(layer.all_layers)    # list() is pass by value (shallow), without list is pass by reference
-        self.all_params = list(layer.all_params)
-        self.all_drop = dict(layer.all_drop)
-        self.all_layers.extend( [self.outputs] )
+        self._connect([layer], layers=[self.outputs])
 
 class ConcatLayer(Layer):
     """
@@ -1315,19 +1696,8 @@ class ConcatLayer(Layer):
         self.outputs = tf.concat(1, self.inputs)
         self.n_units = int(self.outputs._shape[-1])
         print("  tensorlayer:Instantiate ConcatLayer %s, %d" % (self.name, self.n_units))
-        # self.all_layers = list(layer.all_layers)
-        # self.all_params = list(layer.all_params)
-        self.all_layers = list(layer[0].all_layers)
-        self.all_params = list(layer[0].all_params)
-
-        self.all_drop = dict(layer[0].all_drop)
-        for i in range(1, len(layer)):
-            self.all_layers.extend(list(layer[i].all_layers))
-            self.all_params.extend(list(layer[i].all_params))
-            self.all_drop.update(dict(layer[i].all_drop))
-        # self.all_drop = dict(layer.all_drop)
-        # self.all_layers.extend( [self.outputs] )
-        # self.all_params.extend( [W, b] )
+        # the layers and parameters shared by the branches are only listed once
+        self._connect(layer)
 
 class ReshapeLayer(Layer):
     """
@@ -1368,10 +1738,7 @@ class ReshapeLayer(Layer):
         self.outputs = tf.reshape(self.inputs, shape=shape, name=name)
         # self.n_units = int(self.outputs._shape[-1])
         print("  tensorlayer:Instantiate ReshapeLayer %s" % (self.name))
-        self.all_layers = list(layer.all_layers)
-        self.all_params = list(layer.all_params)
-        self.all_drop = dict(layer.all_drop)
-        self.all_layers.extend( [self.outputs] )
+        self._connect([layer], layers=[self.outputs])
 
 ## Developing or Untested
 # dense
@@ -1406,11 +1773,7 @@ class MaxoutLayer(Layer):
         # http://stackoverflow.com/questions/34362193/how-to-explicitly-broadcast-a-tensor-to-match-anothers-shape-in-tensorflow
         # tf.concat tf.pack  tf.tile
 
-        self.all_layers = list(layer.all_layers)
-        self.all_params = list(layer.all_params)
-        self.all_drop = dict(layer.all_drop)
-        self.all_layers.extend( [self.outputs] )
-        self.all_params.extend( [W, b] )
+        self._connect([layer], layers=[self.outputs], params=[W, b])
 
 # noise
 class GaussianNoiseLayer(Layer):
@@ -1570,11 +1933,7 @@ class Conv3dLayer(Layer):
         self.outputs = act( tf.nn.conv3d(self.inputs, W, strides=strides, padding=padding, name=None) + b )
 
 
-        self.all_layers = list(layer.all_layers)
-        self.all_params = list(layer.all_params)
-        self.all_drop = dict(layer.all_drop)
-        self.all_layers.extend( [self.outputs] )
-        self.all_params.extend( [W, b] )
+        self._connect([layer], layers=[self.outputs], params=[W, b])
 
 
 
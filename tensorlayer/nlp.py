@@ -88,6 +88,103 @@ def generate_skip_gram_batch(data, batch_size, num_skips, skip_window, data_inde
         data_index = (data_index + 1) % len(data)
     return batch, labels, data_index
 
+def generate_skip_gram_batches(data, batch_size, num_skips, skip_window, n_batches=1, data_index=0):
+    """Generate many training batches for the Skip-Gram model at once, the
+    vectorized version of :func:`generate_skip_gram_batch`.
+
+    The batches are the same as calling :func:`generate_skip_gram_batch`
+    ``n_batches`` times (same centre words and same ``data_index`` progression),
+    the labels are ``num_skips`` different context words of each centre word,
+    chosen randomly with NumPy.
+
+    Parameters
+    ----------
+    data : a list or numpy.array
+        To present context, word IDs. Use an int32 numpy.array (or np.memmap)
+        to avoid the conversion of the context on every call.
+    batch_size : an int
+        Batch size to return.
+    num_skips : an int
+        How many times to reuse an input to generate a label.
+    skip_window : an int
+        How many words to consider left and right.
+    n_batches : an int
+        The number of batches to return.
+    data_index : an int
+        Index of the context location.
+
+    Returns
+    --------
+    batches : numpy.array
+        Inputs, [n_batches, batch_size]
+    labels : numpy.array
+        Labels, [n_batches, batch_size, 1]
+    data_index : an int
+        Index of the context location for the next call.
+
+    Example
+    --------
+    >>> data = np.asarray(data, dtype=np.int32)
+    >>> batches, labels, data_index = tl.nlp.generate_skip_gram_batches(data=data,
+    ...         batch_size=128, num_skips=2, skip_window=1, n_batches=100, data_index=0)
+    >>> for batch_inputs, batch_labels in zip(batches, labels):
+    >>>     feed_dict = {train_inputs: batch_inputs, train_labels: batch_labels}
+    >>>     sess.run(train_op, feed_dict=feed_dict)
+    """
+    assert batch_size % num_skips == 0
+    assert num_skips <= 2 * skip_window
+    data = np.asarray(data, dtype=np.int32)
+    data_len = len(data)
+    span = 2 * skip_window + 1 # [ skip_window target skip_window ]
+    n_centers = batch_size // num_skips
+    # as generate_skip_gram_batch, each batch moves data_index by span + n_centers
+    starts = data_index + np.arange(n_batches) * (span + n_centers)
+    centers = starts[:, None] + skip_window + np.arange(n_centers)          # [n_batches, n_centers]
+    # choose num_skips different context offsets for each centre word
+    offsets = np.concatenate((np.arange(-skip_window, 0), np.arange(1, skip_window + 1)))
+    choices = np.argsort(np.random.rand(n_batches, n_centers, 2 * skip_window), axis=-1)[..., :num_skips]
+    contexts = centers[..., None] + offsets[choices]                        # [n_batches, n_centers, num_skips]
+    batches = np.repeat(data[centers % data_len], num_skips, axis=-1)
+    labels = data[contexts % data_len].reshape(n_batches, batch_size, 1)
+    data_index = int((data_index + n_batches * (span + n_centers)) % data_len)
+    return batches, labels, data_index
+
+def skip_gram_batch_generator(data, batch_size, num_skips, skip_window, data_index=0, n_batches=100):
+    """Generate a generator that returns the training batches for the Skip-Gram
+    model one by one forever, ``data_index`` is carried internally. The batches
+    are computed ``n_batches`` at a time by :func:`generate_skip_gram_batches`.
+
+    Parameters
+    ----------
+    data : a list or numpy.array
+        To present context, word IDs.
+    batch_size : an int
+        Batch size to return.
+    num_skips : an int
+        How many times to reuse an input to generate a label.
+    skip_window : an int
+        How many words to consider left and right.
+    data_index : an int
+        Index of the context location to start from.
+    n_batches : an int
+        The number of batches computed at a time.
+
+    Example
+    --------
+    >>> batch_gen = tl.nlp.skip_gram_batch_generator(data, batch_size=128,
+    ...                                 num_skips=2, skip_window=1)
+    >>> for step in range(num_steps):
+    >>>     batch_inputs, batch_labels = next(batch_gen)
+    >>>     feed_dict = {train_inputs: batch_inputs, train_labels: batch_labels}
+    >>>     sess.run(train_op, feed_dict=feed_dict)
+    """
+    data = np.asarray(data, dtype=np.int32)
+    while True:
+        batches, labels, data_index = generate_skip_gram_batches(data, batch_size,
+                                num_skips, skip_window, n_batches, data_index)
+        for batch, label in zip(batches, labels):
+            yield batch, label
+
 
 
 
@@ -7,6 +7,10 @@ import tensorlayer as tl
 import numpy as np
 import time
 import numbers
+import ctypes
+import multiprocessing
+import traceback
+from . import iterate
 
 
 def distorted_images(images=None, height=24, width=24):
@@ -153,6 +157,208 @@ def crop_central_whiten_images(images=None, height=24, width=24):
     return result
 
 
+def distort_images_np(images=None, height=24, width=24, rng=None, out=None):
+    """Distort images in NumPy, the same distortions as :func:`distorted_images`
+    with the same random ranges, but computed on the host without TensorFlow.
+
+    Randomly crop height * width pixels, randomly flip from left to right,
+    randomly distort the brightness (delta in [-63, 63]) and the contrast
+    (factor in [0.2, 1.8]), then whiten (normalize) each image.
+
+    Parameters
+    ----------
+    images : 4D numpy.array
+        The images with the shape of [batch_size, row, col, channel].
+    height : int
+        The height for random crop.
+    width: int
+        The width for random crop.
+    rng : numpy.random.RandomState or None
+        The random state, use np.random if None.
+    out : 4D numpy.array or None
+        A float32 array of shape [batch_size, height, width, channel] to write
+        the images into, a new array is returned if None.
+
+    Returns
+    -------
+    out : 4D numpy.array
+        The distorted images.
+
+    Examples
+    --------
+    >>> X_train_a = tl.preprocess.distort_images_np(X_train[0:128], height=24, width=24)
+    """
+    if rng is None:
+        rng = np.random
+    n, row, col, channel = images.shape
+    if out is None:
+        out = np.empty((n, height, width, channel), dtype=np.float32)
+    # 1. Randomly crop a [height, width] section of the image.
+    # 2. Randomly flip the image horizontally.
+    rows = rng.randint(0, row - height + 1, n)
+    cols = rng.randint(0, col - width + 1, n)
+    flips = rng.rand(n) < 0.5
+    for i in range(n):
+        crop = images[i, rows[i]:rows[i] + height, cols[i]:cols[i] + width]
+        out[i] = crop[:, ::-1] if flips[i] else crop
+    # 3. Randomly change brightness.
+    out += rng.uniform(-63, 63, (n, 1, 1, 1)).astype(np.float32)
+    # 4. Randomly change contrast, around the mean of each channel.
+    mean = out.mean(axis=(1, 2), keepdims=True)
+    out -= mean
+    out *= rng.uniform(0.2, 1.8, (n, 1, 1, 1)).astype(np.float32)
+    out += mean
+    # 5. Subtract off the mean and divide by the variance of the pixels.
+    return _whiten_images_np(out)
+
+def _whiten_images_np(images):
+    """In place version of tf.image.per_image_whitening for a batch of images."""
+    n_elements = images[0].size
+    images -= images.mean(axis=(1, 2, 3), keepdims=True)
+    stddev = np.sqrt((images * images).mean(axis=(1, 2, 3), keepdims=True))
+    images /= np.maximum(stddev, 1.0 / np.sqrt(n_elements))
+    return images
+
+def _distort_images_worker(source, source_dtype, source_shape, buffers, buffer_shape, tasks, done, height, width):
+    """Worker process of :class:`DistortedImagesPipeline`."""
+    images = np.frombuffer(source, dtype=source_dtype).reshape(source_shape)
+    outputs = [np.frombuffer(b, dtype=np.float32).reshape(buffer_shape) for b in buffers]
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        batch_idx, slot, excerpt, seed = task
+        try:
+            batch = images[excerpt]
+            distort_images_np(batch, height, width, rng=np.random.RandomState(seed),
+                                out=outputs[slot][:len(batch)])
+            done.put((batch_idx, slot, None))
+        except Exception:
+            done.put((batch_idx, slot, traceback.format_exc()))
+
+class DistortedImagesPipeline(object):
+    """
+    The :class:`DistortedImagesPipeline` class returns minibatches of images
+    distorted by :func:`distort_images_np` in a pool of worker processes, so the
+    preprocessing runs on the host in parallel with the training step, instead
+    of running :func:`distorted_images` in an extra ``sess.run`` per batch.
+
+    The source images are copied once into shared memory, which the workers
+    read, and the workers write the distorted images into shared-memory
+    buffers, so no image is pickled between the processes, with any start
+    method of multiprocessing (fork, spawn or forkserver). Iterating over the instance runs one
+    epoch and returns (images, targets); the images are a view of a shared
+    buffer which is reused, so it is valid until the next batch is requested.
+    Call ``close()`` to stop the worker processes.
+
+    Parameters
+    ----------
+    images : 4D numpy.array
+        The images with the shape of [n_examples, row, col, channel].
+    targets : numpy.array
+        The labels of images.
+    batch_size : int
+        The batch size.
+    height : int
+        The height for random crop.
+    width: int
+        The width for random crop.
+    shuffle : boolean
+        Indicating whether to shuffle the dataset before each epoch.
+    n_workers : int
+        The number of worker processes.
+    n_buffers : int or None
+        The number of shared-memory batch buffers, i.e. the batches processed
+        ahead of the consumer. Use n_workers + 1 if None.
+
+    Examples
+    --------
+    >>> X_train, y_train, X_test, y_test = tl.files.load_cifar10_dataset(shape=(-1, 32, 32, 3), plotable=False)
+    >>> x_crop = tf.placeholder(tf.float32, shape=[batch_size, 24, 24, 3])
+    >>> pipeline = tl.preprocess.DistortedImagesPipeline(X_train, y_train,
+    ...                     batch_size=128, height=24, width=24, n_workers=4)
+    >>> for epoch in range(n_epoch):
+    >>>     for X_train_a, y_train_a in pipeline:
+    >>>         feed_dict = {x_crop: X_train_a, y_: y_train_a}
+    >>>         sess.run(train_op, feed_dict=feed_dict)
+    >>> pipeline.close()
+
+    Notes
+    ------
+    The random numbers of each batch are drawn from np.random in the main
+    process, so the results do not depend on the number of workers.
+    """
+    def __init__(
+        self,
+        images = None,
+        targets = None,
+        batch_size = 128,
+        height = 24,
+        width = 24,
+        shuffle = True,
+        n_workers = 4,
+        n_buffers = None,
+    ):
+        assert len(images) == len(targets)
+        images = np.asarray(images)
+        source = multiprocessing.RawArray(ctypes.c_char, max(1, images.nbytes))
+        # self.images is the shared copy, the caller can free the original
+        self.images = np.frombuffer(source, dtype=images.dtype, count=images.size).reshape(images.shape)
+        self.images[...] = images
+        self.targets = targets
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.n_buffers = n_buffers or n_workers + 1
+        buffer_shape = (batch_size, height, width, images.shape[3])
+        n_floats = int(np.prod(buffer_shape))
+        buffers = [multiprocessing.RawArray(ctypes.c_float, n_floats) for _ in range(self.n_buffers)]
+        self._outputs = [np.frombuffer(b, dtype=np.float32).reshape(buffer_shape) for b in buffers]
+        self._tasks = multiprocessing.Queue()
+        self._done = multiprocessing.Queue()
+        self._workers = []
+        for _ in range(n_workers):
+            worker = multiprocessing.Process(target=_distort_images_worker,
+                        args=(source, images.dtype.str, images.shape, buffers, buffer_shape,
+                                self._tasks, self._done, height, width))
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+    def __iter__(self):
+        excerpts = list(iterate._minibatch_excerpts(len(self.images), self.batch_size, self.shuffle))
+        free = list(range(self.n_buffers))
+        ready = {}
+        n_sent, n_received = 0, 0
+        try:
+            for batch_idx in range(len(excerpts)):
+                while free and n_sent < len(excerpts):
+                    seed = np.random.randint(2 ** 31 - 1)
+                    self._tasks.put((n_sent, free.pop(), excerpts[n_sent], seed))
+                    n_sent += 1
+                while batch_idx not in ready:
+                    idx, slot, error = self._done.get()
+                    n_received += 1
+                    if error is not None:
+                        raise Exception("Worker failed to distort images:\n%s" % error)
+                    ready[idx] = slot
+                slot = ready.pop(batch_idx)
+                yield self._outputs[slot], self.targets[excerpts[batch_idx]]
+                free.append(slot)
+        finally:
+            # wait for the batches in flight, so the buffers are free for the next epoch
+            while n_received < n_sent:
+                self._done.get()
+                n_received += 1
+
+    def close(self):
+        """Stop the worker processes."""
+        for _ in self._workers:
+            self._tasks.put(None)
+        for worker in self._workers:
+            worker.join()
+        self._workers = []
+
+
 
 
 
@@ -67,6 +67,11 @@ def class_balancing_oversample(X_train=None, y_train=None, printable=True):
     Examples
     --------
     >>> X_train, y_train = class_balancing_oversample(X_train, y_train, printable=True)
+
+    Notes
+    -----
+    This function copies the dataset, to draw class-balanced minibatches from
+    the original arrays without any copy, see :func:`tensorlayer.iterate.class_balanced_minibatches`.
     """
     # ======== Classes balancing
     if printable:
@@ -0,0 +1,133 @@
+#! /usr/bin/python
+# -*- coding: utf8 -*-
+
+"""Tests of tl.files.maybe_download_and_extract against a local HTTP server.
+
+$ python -m unittest discover -s tests
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import numpy as np
+from six.moves import BaseHTTPServer
+from six.moves import socketserver
+
+import tensorlayer as tl
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Serve the bytes of server.files, with range requests and If-Range if
+    server.ranges, and count the body bytes sent in server.sent.
+    """
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        data = self.server.files.get(self.path.lstrip('/'))
+        if data is None:
+            self.send_error(404)
+            return
+        etag = '"%s"' % hashlib.sha256(data).hexdigest()[:16]
+        byte_range = self.headers.get('Range')
+        if_range = self.headers.get('If-Range')
+        if self.server.ranges and byte_range and (if_range is None or if_range == etag):
+            start, end = [int(x) for x in byte_range.split('=')[1].split('-')]
+            body = data[start:end + 1]
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes %d-%d/%d' % (start, end, len(data)))
+        else:
+            body = data
+            self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        with self.server.lock:
+            self.server.sent += len(body)
+
+
+class _Server(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+class DownloadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = _Server(('127.0.0.1', 0), _Handler)
+        self.server.files, self.server.ranges = {}, True
+        self.server.sent, self.server.lock = 0, threading.Lock()
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.url = 'http://127.0.0.1:%d/' % self.server.server_address[1]
+        self.folder = tempfile.mkdtemp()
+        # 2.5 MB, downloaded in 2 parts of at least 1 MB
+        self.data = np.random.RandomState(0).randint(0, 256, size=5 << 19).astype(np.uint8).tobytes()
+        self.server.files['data.bin'] = self.data
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.folder)
+
+    def download(self, **kwargs):
+        return tl.files.maybe_download_and_extract('data.bin', self.folder, self.url, **kwargs)
+
+    def test_download_in_parts(self):
+        filepath = self.download(sha256=hashlib.sha256(self.data).hexdigest())
+        with open(filepath, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertEqual(os.listdir(self.folder), ['data.bin'])
+
+    def test_resume_partial_part(self):
+        # the first 100000 bytes of the first part, from a download of the same file
+        filepath = os.path.join(self.folder, 'data.bin')
+        with open(filepath + '.part0-of-2', 'wb') as f:
+            f.write(self.data[:100000])
+        etag = '"%s"' % hashlib.sha256(self.data).hexdigest()[:16]
+        with open(filepath + '.parts.json', 'w') as f:
+            json.dump({'url': self.url + 'data.bin', 'size': len(self.data), 'validator': etag}, f)
+        self.download(n_threads=2)
+        with open(filepath, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+        # the probe request sends 1 byte, the parts the bytes which were missing
+        self.assertEqual(self.server.sent, 1 + len(self.data) - 100000)
+        self.assertEqual(os.listdir(self.folder), ['data.bin'])
+
+    def test_drop_parts_of_changed_file(self):
+        filepath = os.path.join(self.folder, 'data.bin')
+        with open(filepath + '.part0-of-2', 'wb') as f:
+            f.write(b'x' * 100000)
+        with open(filepath + '.parts.json', 'w') as f:
+            json.dump({'url': self.url + 'data.bin', 'size': len(self.data), 'validator': '"old"'}, f)
+        self.download(n_threads=2)
+        with open(filepath, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+
+    def test_server_ignores_range(self):
+        self.server.ranges = False
+        filepath = self.download(sha256=hashlib.sha256(self.data).hexdigest())
+        with open(filepath, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+        # the response to the probe request is the download
+        self.assertEqual(self.server.sent, len(self.data))
+
+    def test_reject_sha256_mismatch(self):
+        with self.assertRaises(Exception):
+            self.download(sha256=hashlib.sha256(b'other').hexdigest())
+        self.assertEqual(os.listdir(self.folder), [])
+
+    def test_reject_size_mismatch(self):
+        with self.assertRaises(Exception):
+            self.download(expected_bytes=len(self.data) + 1)
+        self.assertEqual(os.listdir(self.folder), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
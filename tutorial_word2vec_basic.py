@@ -243,6 +243,9 @@ def main_word2vec_basic():
     # save vocabulary to txt
     tl.files.save_vocab(count, name='vocab_text8.txt')
 
+    # save the model in the background, the training only waits for the parameters to be fetched
+    ckpt_writer = tl.files.CheckpointWriter(emb_net.all_params, sess=sess)
+
     average_loss = 0
 
     # for step in xrange(num_steps):
@@ -283,7 +286,7 @@ def main_word2vec_basic():
             # instead of using TensorFlow saver, we use TensorLayer to save a model
             # saver = tf.train.Saver()
             # save_path = saver.save(sess, model_file_name+'.ckpt')
-            tl.files.save_npz(emb_net.all_params, name=model_file_name+'.npz')
+            ckpt_writer.save(model_file_name+'.npz')
             tl.files.save_any_to_npy(save_dict={'data': data, 'count': count,
                 'dictionary': dictionary, 'reverse_dictionary':
                 reverse_dictionary}, name=model_file_name+'.npy')
@@ -295,6 +298,7 @@ def main_word2vec_basic():
                 learning_rate = float(input("Input new learning rate: "))
                 train_op = tf.train.GradientDescentOptimizer(learning_rate).minimize(cost)
         step += 1
+    ckpt_writer.close()
 
 
     """ Step 6: Visualize the normalized embedding matrix by t-SNE.